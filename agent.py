@@ -4,7 +4,13 @@ from langgraph.graph.message import add_messages
 from typing import TypedDict, Annotated
 import pandas as pd
 import numpy as np
-import anthropic
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from backends import AnthropicBackend
+from score_parser import parse_score, find_answer
 
 class AgentState(TypedDict):
     """Состояние агента"""
@@ -13,9 +19,23 @@ class AgentState(TypedDict):
     profile: str
     search_performed: bool
     search_results: str
+    extra_context: str
+    time_to_answer: float
+    row: dict
+    bias: str
+    q_num: int
+    draw: int
+    questions: dict
+    answers: dict
+    row_id: object
+    invocation: int
 
-class Agent:
-    """LangGraph агент с Anthropic API"""
+class AgentEngine:
+    """
+    LangGraph агент поверх LLM-бэкенда (по умолчанию Anthropic API, см. backends.py).
+    Долгоживущий объект: один бэкенд (клиент с пулом HTTP-соединений или локальная модель) и один
+    скомпилированный граф на весь прогон. Строка респондента, bias и номер вопроса передаются в граф через состояние.
+    """
     biases = ['стадность','излишняя самоуверенность']
     sex = {1: 'мужчина', 2: 'женщина'}
     tip = {1:'Москва или Санкт-Петербург',
@@ -58,78 +78,200 @@ class Agent:
        6: 'неизвестное образование',
        999: 'неизвестное образование'}
     
-    def __init__(self, api_key: str, row: pd.Series, q_num:int, model: str = "claude-sonnet-4-20250514"):#claude-3-sonnet-20240229
+    # колонки строки, от которых зависит текст профиля (create_profile)
+    profile_columns = ["PROF", "SEX", "AGE", "FO", "TIP", "DOHOD", "EDU"]
+    usage_fields = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+    def __init__(self, api_key: str = None, model: str = "claude-sonnet-4-20250514",#claude-3-sonnet-20240229
+                 limiter=None, max_retries: int = 5, cache=None, stream_final: bool = False,
+                 prompt_caching: bool = False, backend=None, tracer=None):
         """
-        Инициализация агента с Anthropic API
+        Инициализация движка
         
         Args:
-            api_key: API ключ для Anthropic
-            row: строка с демографическими данными
+            api_key: API ключ для Anthropic (не нужен, если передан backend)
             model: модель Claude для использования
+            limiter: общий runner.RateLimiter для соблюдения лимитов requests/min и tokens/min
+            max_retries: сколько раз повторять запрос после 429 / overloaded
+            cache: cache.ResponseCache для повторного использования ответов между прогонами
+            stream_final: получать финальный ответ потоком и обрывать генерацию,
+                как только пришла строка «Ответ: «...» - N» (пояснение после нее не генерируется)
+            prompt_caching: передавать системный промпт финального ответа двумя блоками: профиль и ситуация
+                персоны с cache_control, затем дополнительный контекст (сценарий шока в sweep) и инструкция без него.
+                Префикс персоны общий у вопросов сессии (session), ответов ячейки (planner) и всех сценариев
+                ячейки (sweep). Текст промпта тот же, что и без кэширования. API кэширует префикс только
+                от 1024 токенов (Sonnet), поэтому выигрыш есть, лишь когда описание ситуации достаточно длинное;
+                более короткий префикс не кэшируется и стоит как обычно (проверяется по usage_stats)
+            backend: backends.LLMBackend (HFBackend для локальной модели, StubBackend для тестов);
+                по умолчанию AnthropicBackend(api_key)
+            tracer: tracing.RunTrace - время, токены, повторы и стоимость каждого node по строкам
         """
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.backend = backend if backend is not None else AnthropicBackend(api_key)
         self.model = model
-        self.row = row        
-        self.bias = np.random.choice(self.biases, 1)[0]
-        self.q_num = q_num
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.cache = cache
+        self.stream_final = stream_final
+        self.prompt_caching = prompt_caching
+        # суммарный расход токенов по message.usage, включая чтение/запись кэша промпта
+        self.usage = dict.fromkeys(self.usage_fields, 0)
+        self.usage_lock = threading.Lock()
+        self.tracer = tracer
+        # запись трассы текущего node: node и его вызовы LLM выполняются в одном потоке
+        self.trace_local = threading.local()
         self.graph = self._create_graph()
 
-    def extract_inflation_score(self, response: str) -> int:
-        """Извлекает числовую оценку инфляции из ответа модели"""
-        if self.q_num == 1:
-            # Ищем число от 0 до 5 в ответе
-            if "Серьезно вырастут" in response:
-                return 5
-            elif "Незначительно вырастут" in response:
-                return 4
-            elif "Останутся на нынешнем уровне" in response:
-                return 3
-            elif "Незначительно снизятся" in response:
-                return 2
-            elif "Серьезно снизятся" in response:
-                return 1
-            else:
-                return 0
-        else:
-            # Ищем число от 0 до 3 в ответе
-            if "Инфляция очень высокая" in response:
-                return 3
-            elif "Инфляция умеренная" in response:
-                return 2
-            elif "Инфляция незначительная" in response:
-                return 1
-            else:
-                return 0
+    @classmethod
+    def draw_bias(cls) -> str:
+        """Случайно выбирает когнитивное искажение персоны"""
+        return np.random.choice(cls.biases, 1)[0]
+
+    @classmethod
+    def row_seed(cls, row, seed: int, row_id: int = None) -> int:
+        """
+        Seed строки, который зависит только от общего seed, явного номера строки row_id и значений
+        profile_columns. Индекс DataFrame и остальные колонки не учитываются: после записи выборки в CSV
+        и повторного чтения они меняются (RangeIndex, колонка Unnamed: 0)
+        """
+        key = json.dumps([seed, row_id, [str(row.get(column)) for column in cls.profile_columns]])
+        return int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "little")
+
+    @classmethod
+    def seeded_bias(cls, row, seed: int, row_id: int = None) -> str:
+        """Воспроизводимый выбор когнитивного искажения для строки (см. row_seed)"""
+        rng = np.random.default_rng(cls.row_seed(row, seed, row_id))
+        return cls.biases[rng.integers(len(cls.biases))]
 
     @staticmethod
-    def save_responses_to_csv(responses: list, filename: str):
-        """Сохраняет список ответов с числовыми оценками в CSV файл"""
-        df = pd.DataFrame(responses, columns=['response', 'inflation_score'])
-        df.to_csv(filename, index=True, encoding='utf-8')
-        print(f"Результаты сохранены в файл: {filename}")
-        
-    def _generate_text(self, system_prompt: str, user_prompt: str) -> str:
-        """Генерация текста через Anthropic API"""
-        try:
-            message = self.client.messages.create(
-                model=self.model,
-                max_tokens=1024,
-                temperature=0.7,
-                system=system_prompt,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": user_prompt
-                    }
-                ]
-            )
-            return message.content[0].text
-        except Exception as e:
-            return f"Ошибка генерации: {str(e)}"
+    def extract_inflation_score(response: str, q_num: int) -> int:
+        """Извлекает числовую оценку инфляции из ответа модели (см. score_parser.parse_scores)"""
+        return parse_score(response, q_num)
+
+    def _record_usage(self, usage) -> int:
+        """Добавляет message.usage к общему счетчику; возвращает число токенов для планировщика лимитов"""
+        values = {field: getattr(usage, field, None) or 0 for field in self.usage_fields}
+        with self.usage_lock:
+            for field, value in values.items():
+                self.usage[field] += value
+        self._trace_add(requests=1, **values)
+        return sum(values.values())
+
+    def _trace_add(self, **values):
+        """Добавляет счетчики к записи трассы текущего node (если трасса включена)"""
+        record = getattr(self.trace_local, "record", None)
+        if record is None:
+            return
+        for field, value in values.items():
+            record[field] += value
+
+    def _traced(self, name: str, node, nested: bool = False):
+        """
+        Оборачивает node графа записью в трассу: время node и все его вызовы LLM.
+        nested - node вызывается внутри другого node (его время не добавляется к времени строки)
+        """
+        if self.tracer is None:
+            return node
 
-    def create_profile(self): 
+        def run(state: AgentState) -> AgentState:
+            record = self.tracer.start(state.get("invocation"), state.get("row_id"), name, state.get("q_num"),
+                                       self.model, nested)
+            self.trace_local.record = record
+            started = time.perf_counter()
+            try:
+                return node(state)
+            except Exception:
+                record["error"] = True
+                raise
+            finally:
+                record["seconds"] = time.perf_counter() - started
+                self.trace_local.record = None
+                self.tracer.finish(record)
+
+        return run
+
+    def usage_stats(self) -> dict:
+        """Расход токенов с момента создания движка, включая cache_read / cache_creation"""
+        with self.usage_lock:
+            return dict(self.usage)
+
+    @staticmethod
+    def _prompt_length(prompt) -> int:
+        """Длина промпта в символах: строка или список блоков {"type": "text", "text": ...}"""
+        if isinstance(prompt, str):
+            return len(prompt)
+        return sum(len(block["text"]) for block in prompt)
+
+    def _generate_text(self, system_prompt, user_prompt: str, max_tokens: int = 1024, temperature: float = 0.7,
+                       draw: int = 0, stop_at_answer: int = None) -> str:
+        """
+        Генерация текста через бэкенд (с кэшем, если он передан).
+        system_prompt - строка или список текстовых блоков (для кэширования префикса промпта).
+        stop_at_answer - номер вопроса: генерация идет потоком и обрывается после итоговой строки ответа
+        """
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model, system_prompt, user_prompt, temperature, max_tokens, draw,
+                                            stop_at_answer)
+            # в режиме replay промах вызывает cache.CacheMiss: запрос в API не отправляется
+            cached = self.cache.require(cache_key)
+            if cached is not None:
+                self._trace_add(cache_hits=1)
+                return cached
+
+        # грубая оценка токенов запроса для планировщика: ~3 символа на токен плюс максимум ответа
+        estimated = (self._prompt_length(system_prompt) + len(user_prompt)) // 3 + max_tokens
+        attempt = 0
+        while True:
+            try:
+                if self.limiter is not None:
+                    self.limiter.acquire(estimated)
+                request = dict(
+                    model=self.model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system_prompt,
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": user_prompt
+                        }
+                    ]
+                )
+                if stop_at_answer is None:
+                    text, usage = self.backend.generate(request)
+                else:
+                    text, usage = self.backend.generate_until(
+                        request, lambda text: find_answer(text, stop_at_answer) is not None
+                    )
+                used = self._record_usage(usage)
+                if self.limiter is not None:
+                    self.limiter.settle(estimated, used)
+                break
+            except Exception as e:
+                delay = self.backend.retry_delay(e, attempt) if attempt < self.max_retries else None
+                if delay is None:
+                    self._trace_add(error=True)
+                    return f"Ошибка генерации: {str(e)}"
+                attempt += 1
+                self._trace_add(retries=1)
+                if self.limiter is not None:
+                    self.limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+
+        # в кэш попадают только успешные ответы, строки "Ошибка генерации: ..." не сохраняются;
+        # сбой записи в кэш (например, блокировка SQLite при общем кэше нескольких процессов)
+        # не должен превращать уже оплаченный ответ в ошибку
+        if cache_key is not None:
+            try:
+                self.cache.put(cache_key, text)
+            except Exception as e:
+                print(f"Не удалось сохранить ответ в кэш: {e}")
+        return text
+
+    def create_profile(self, row, bias: str): 
         """Создает промпт на основе demographics_info и bias"""
-        profile_prompt = f"""Представь, что сейчас 2023 года, ТЫ {self.prof[self.row['PROF']]} {self.sex[self.row['SEX']]} {self.row['AGE']} лет, проживающий в России ({self.fo[self.row['FO']]}) в {self.tip[self.row['TIP']]}. Твое материальное состояние можно охарактеризовать, как {self.dohod[self.row['DOHOD']]}. Ты получил {self.edu[self.row['EDU']]}. Тебе присуща {self.bias}.    
+        profile_prompt = f"""Представь, что сейчас 2023 года, ТЫ {self.prof[row['PROF']]} {self.sex[row['SEX']]} {row['AGE']} лет, проживающий в России ({self.fo[row['FO']]}) в {self.tip[row['TIP']]}. Твое материальное состояние можно охарактеризовать, как {self.dohod[row['DOHOD']]}. Ты получил {self.edu[row['EDU']]}. Тебе присуща {bias}.    
         """
         return profile_prompt
 
@@ -140,26 +282,36 @@ class Agent:
         graph_builder = StateGraph(AgentState)
         
         # Добавляем nodes
-        graph_builder.add_node("initialize_profile", self._initialize_profile_node)
-        graph_builder.add_node("search", self._search_node)
-        graph_builder.add_node("generate_response", self._generate_response_node)
+        graph_builder.add_node("initialize_profile", self._traced("initialize_profile", self._initialize_profile_node))
+        graph_builder.add_node("search", self._traced("search", self._search_node))
+        graph_builder.add_node("generate_response", self._traced("generate_response", self._generate_response_node))
+        graph_builder.add_node("answer_questions", self._traced("answer_questions", self._answer_questions_node))
         
         # Добавляем edges
         graph_builder.add_edge(START, "initialize_profile")
-        graph_builder.add_edge("initialize_profile", "search")  # Обязательный поиск
-        graph_builder.add_edge("search", "generate_response")
+        # Поиск пропускается, если контекст персоны уже посчитан (см. planner.py)
+        graph_builder.add_conditional_edges(
+            "initialize_profile",
+            lambda state: self._after_search(state) if state["search_performed"] else "search",
+            ["search", "generate_response", "answer_questions"]
+        )
+        # В режиме сессии (session) после поиска отвечаем сразу на все вопросы
+        graph_builder.add_conditional_edges("search", self._after_search, ["generate_response", "answer_questions"])
         graph_builder.add_edge("generate_response", END)
+        graph_builder.add_edge("answer_questions", END)
         
         return graph_builder.compile()
 
+    @staticmethod
+    def _after_search(state: AgentState) -> str:
+        return "answer_questions" if state.get("questions") else "generate_response"
+
     def _initialize_profile_node(self, state: AgentState) -> AgentState:
         """Node для инициализации профиля"""
-        profile = self.create_profile()
+        profile = self.create_profile(state['row'], state['bias'])
         return {
             **state,
-            "profile": profile,
-            "search_performed": False,
-            "search_results": ""
+            "profile": profile
         }
         
     def _search_node(self, state: AgentState) -> AgentState:
@@ -178,27 +330,140 @@ class Agent:
         system_prompt = f"""{state['profile']}\n. Отвечай от первого лица, учитывая свой профиль."""
         return self._generate_text(system_prompt, query)
 
+    def _cached_prompt(self, state: AgentState):
+        """
+        Тот же промпт финального ответа, что и без кэширования, но системный промпт разбит на блоки:
+        профиль и ситуация персоны с cache_control (общие у вопросов сессии, ответов и сценариев ячейки),
+        затем сценарий и инструкция. Вопрос остается в сообщении пользователя.
+        Префикс кэшируется, только если он не короче минимума API (1024 токена)
+        """
+        system_prompt = [
+            {
+                "type": "text",
+                "text": self._persona_prompt(state),
+                "cache_control": {"type": "ephemeral"}
+            },
+            {
+                "type": "text",
+                "text": self._instruction_prompt(state)
+            }
+        ]
+        return system_prompt, state['user_query']
+
+    @staticmethod
+    def _persona_prompt(state: AgentState) -> str:
+        return f"""{state['profile']}\n{state['search_results']}"""
+
+    @staticmethod
+    def _instruction_prompt(state: AgentState) -> str:
+        extra_context = state.get('extra_context')
+        instruction = "Отвечай от первого лица, полностью вживаясь в роль описанного человека."
+        return f"{extra_context}\n{instruction}" if extra_context else instruction
+
+    def _system_prompt(self, state: AgentState) -> str:
+        return f"{self._persona_prompt(state)}\n{self._instruction_prompt(state)}"
+
     def _generate_response_node(self, state: AgentState) -> AgentState:
         """Node для генерации финального ответа"""
-        system_prompt = f"""{state['profile']}\n{state['search_results']}\nОтвечай от первого лица, полностью вживаясь в роль описанного человека."""
+        if self.prompt_caching:
+            system_prompt, user_prompt = self._cached_prompt(state)
+        else:
+            system_prompt = self._system_prompt(state)
+            user_prompt = state['user_query']
         
-        response = self._generate_text(system_prompt, state['user_query'])
+        started = time.perf_counter()
+        response = self._generate_text(system_prompt, user_prompt, draw=state['draw'],
+                                       stop_at_answer=state['q_num'] if self.stream_final else None)
         
         return {
             **state,
-            "messages": [AIMessage(content=response)]
+            "messages": [AIMessage(content=response)],
+            "time_to_answer": time.perf_counter() - started
         }
 
-    def process_query(self, query: str) -> str:
-        """Обрабатывает запрос пользователя через LangGraph"""
+    def _answer_questions_node(self, state: AgentState) -> AgentState:
+        """Node сессии: параллельно отвечает на все вопросы с общим профилем и описанием ситуации"""
+        def answer_one(item):
+            q_num, query = item
+            try:
+                result = self._traced("generate_response", self._generate_response_node, nested=True)(
+                    {**state, "user_query": query, "q_num": q_num}
+                )
+                response = result["messages"][-1].content
+                time_to_answer = result["time_to_answer"]
+            except Exception as e:
+                response = f"Ошибка при обработке запроса: {str(e)}"
+                time_to_answer = None
+            return q_num, {
+                "response": response,
+                "inflation_score": self.extract_inflation_score(response, q_num),
+                "time_to_answer": time_to_answer
+            }
+
+        questions = list(state["questions"].items())
+        with ThreadPoolExecutor(max_workers=len(questions)) as executor:
+            answers = dict(executor.map(answer_one, questions))
+        return {
+            **state,
+            "answers": answers
+        }
+
+    def describe_situation(self, row, bias: str) -> str:
+        """
+        Выполняет только шаг search: описание экономической ситуации персоны.
+        В трассе это node search с отдельным номером вызова (planner и sweep вызывают его вне графа)
+        """
+        state = {
+            "profile": self.create_profile(row, bias),
+            "row_id": getattr(row, "name", None),
+            "invocation": self.tracer.next_invocation() if self.tracer is not None else None,
+            "q_num": None
+        }
+        return self._traced("search", self._create_search_query)(state)
+
+    def process_query(self, query: str, row, q_num: int, bias: str = None, draw: int = 0,
+                      search_results: str = None, extra_context: str = None) -> str:
+        """Обрабатывает запрос пользователя через LangGraph и возвращает текст ответа"""
+        return self.answer(query, row, q_num, bias, draw, search_results, extra_context)["response"]
+
+    def answer(self, query: str, row, q_num: int, bias: str = None, draw: int = 0,
+               search_results: str = None, extra_context: str = None) -> dict:
+        """
+        Обрабатывает запрос пользователя через LangGraph
+
+        Args:
+            query: текст вопроса
+            row: строка с демографическими данными
+            q_num: номер вопроса
+            bias: когнитивное искажение персоны; если не задано - выбирается случайно
+            draw: номер независимой попытки финального ответа (различает ответы одной персоны в кэше)
+            search_results: готовое описание ситуации персоны (describe_situation);
+                если передано, шаг search пропускается
+            extra_context: контекст после описания ситуации (например, новость о шоке в sweep);
+                в кэшируемый префикс промпта (prompt_caching) не входит
+
+        Returns:
+            словарь response, inflation_score и time_to_answer - секунды от запроса финального ответа
+            до получения итоговой строки (или всего текста, если stream_final выключен)
+        """
         try:
             # Инициализируем состояние
             initial_state = {
                 "messages": [HumanMessage(content=query)],
                 "user_query": query,
                 "profile": "",
-                "search_performed": False,
-                "search_results": ""
+                "search_performed": search_results is not None,
+                "search_results": search_results or "",
+                "extra_context": extra_context or "",
+                "time_to_answer": None,
+                "row": dict(row),
+                "row_id": getattr(row, "name", None),
+                "invocation": self.tracer.next_invocation() if self.tracer is not None else None,
+                "bias": bias if bias is not None else self.draw_bias(),
+                "q_num": q_num,
+                "draw": draw,
+                "questions": {},
+                "answers": {}
             }
             
             # Запускаем граф
@@ -206,10 +471,110 @@ class Agent:
             
             # Возвращаем последнее сообщение
             if result.get("messages") and len(result["messages"]) > 0:
-                return result["messages"][-1].content
+                response = result["messages"][-1].content
             else:
-                return "Не удалось получить ответ."
+                response = "Не удалось получить ответ."
+            time_to_answer = result.get("time_to_answer")
                 
         except Exception as e:
-            return f"Ошибка при обработке запроса: {str(e)}"
+            response = f"Ошибка при обработке запроса: {str(e)}"
+            time_to_answer = None
 
+        return {
+            "response": response,
+            "inflation_score": self.extract_inflation_score(response, q_num),
+            "time_to_answer": time_to_answer
+        }
+
+    def session(self, questions: dict, row, bias: str = None, draw: int = 0, search_results: str = None) -> dict:
+        """
+        Сессия персоны: профиль и описание ситуации строятся один раз, затем на все вопросы
+        отвечают параллельно (для двух вопросов - 3 вызова LLM вместо 4, один bias на оба ответа)
+
+        Args:
+            questions: {q_num: текст вопроса}
+            row, bias, draw, search_results: как в answer
+
+        Returns:
+            {q_num: словарь response, inflation_score, time_to_answer (как в answer)}
+        """
+        try:
+            initial_state = {
+                "messages": [],
+                "user_query": "",
+                "profile": "",
+                "search_performed": search_results is not None,
+                "search_results": search_results or "",
+                "extra_context": "",
+                "time_to_answer": None,
+                "row": dict(row),
+                "row_id": getattr(row, "name", None),
+                "invocation": self.tracer.next_invocation() if self.tracer is not None else None,
+                "bias": bias if bias is not None else self.draw_bias(),
+                "q_num": None,
+                "draw": draw,
+                "questions": dict(questions),
+                "answers": {}
+            }
+            return self.graph.invoke(initial_state)["answers"]
+        except Exception as e:
+            response = f"Ошибка при обработке запроса: {str(e)}"
+            return {
+                q_num: {"response": response, "inflation_score": self.extract_inflation_score(response, q_num),
+                        "time_to_answer": None}
+                for q_num in questions
+            }
+
+
+class Agent:
+    """
+    Агент для одной строки выборки: хранит row, q_num и bias и делегирует работу AgentEngine.
+    Чтобы не создавать клиент и граф на каждую строку, передавайте общий engine.
+    """
+    biases = AgentEngine.biases
+
+    def __init__(self, api_key: str, row: pd.Series, q_num:int, model: str = "claude-sonnet-4-20250514",
+                 limiter=None, max_retries: int = 5, cache=None, bias: str = None, draw: int = 0,
+                 engine: AgentEngine = None, seed: int = None, row_id: int = None):
+        """
+        Args:
+            api_key: API ключ для Anthropic
+            row: строка с демографическими данными
+            q_num: номер вопроса
+            model, limiter, max_retries, cache: параметры AgentEngine (если engine не передан)
+            bias: когнитивное искажение персоны; если не задано - выбирается случайно
+            draw: номер независимой попытки финального ответа
+            engine: общий AgentEngine
+            seed: если bias не задан, он выбирается воспроизводимо по seed и строке (AgentEngine.seeded_bias)
+            row_id: номер строки в выборке для seeded_bias; тот же, что в runner.run_concurrent
+        """
+        self.engine = engine if engine is not None else AgentEngine(api_key, model, limiter, max_retries, cache)
+        self.row = row
+        self.q_num = q_num
+        if bias is None:
+            bias = AgentEngine.seeded_bias(row, seed, row_id) if seed is not None else AgentEngine.draw_bias()
+        self.bias = bias
+        self.draw = draw
+
+    def extract_inflation_score(self, response: str) -> int:
+        """Извлекает числовую оценку инфляции из ответа модели"""
+        return AgentEngine.extract_inflation_score(response, self.q_num)
+
+    @staticmethod
+    def save_responses_to_csv(responses: list, filename: str):
+        """Сохраняет список ответов с числовыми оценками в CSV файл"""
+        df = pd.DataFrame(responses, columns=['response', 'inflation_score'])
+        df.to_csv(filename, index=True, encoding='utf-8')
+        print(f"Результаты сохранены в файл: {filename}")
+
+    def create_profile(self):
+        """Создает промпт на основе demographics_info и bias"""
+        return self.engine.create_profile(self.row, self.bias)
+
+    def describe_situation(self) -> str:
+        """Выполняет только шаг search: описание экономической ситуации персоны"""
+        return self.engine.describe_situation(self.row, self.bias)
+
+    def process_query(self, query: str, search_results: str = None) -> str:
+        """Обрабатывает запрос пользователя через LangGraph"""
+        return self.engine.process_query(query, self.row, self.q_num, self.bias, self.draw, search_results)
@@ -0,0 +1,185 @@
+import math
+import threading
+import pandas as pd
+
+
+class RunningStats:
+    """
+    Накапливаемая статистика одного ряда значений: count, mean, variance (алгоритм Уэлфорда),
+    min/max и разреженная гистограмма с шагом bin_width, по которой оцениваются квантили.
+    Обновление - O(1), ошибка квантилей не больше bin_width.
+    """
+
+    def __init__(self, bin_width: float = 0.1):
+        self.bin_width = bin_width
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.bins = {}
+
+    def update(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = math.floor(value / self.bin_width)
+        self.bins[bucket] = self.bins.get(bucket, 0) + 1
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Квантиль по гистограмме с линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bucket in sorted(self.bins):
+            n = self.bins[bucket]
+            if seen + n >= target:
+                left = bucket * self.bin_width
+                value = left + (target - seen) / n * self.bin_width
+                return min(max(value, self.min), self.max)
+            seen += n
+        return self.max
+
+    def histogram(self) -> dict:
+        """{левая граница корзины: число ответов}"""
+        return {round(bucket * self.bin_width, 10): n for bucket, n in sorted(self.bins.items())}
+
+    def to_dict(self, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean if self.count else None,
+            "variance": self.variance,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "quantiles": {str(q): self.quantile(q) for q in quantiles},
+            "histogram": self.histogram()
+        }
+
+
+class SurveyAggregates:
+    """
+    Агрегаты inflation_prediction по сценариям, поддерживаемые по мере поступления ответов.
+
+    Для каждого scenario ведется общий RunningStats и, если заданы slice_keys,
+    отдельный RunningStats на каждое значение additional_data[key].
+    """
+
+    def __init__(self, slice_keys: list = (), bin_width: float = 0.1):
+        self.slice_keys = list(slice_keys)
+        self.bin_width = bin_width
+        self.by_scenario = {}
+        self.by_slice = {}
+        self.lock = threading.Lock()
+
+    def _stats(self, table: dict, key) -> RunningStats:
+        if key not in table:
+            table[key] = RunningStats(self.bin_width)
+        return table[key]
+
+    def update(self, record: dict):
+        """Учитывает один ответ (словарь в формате ResponseData)"""
+        self.update_many([record])
+
+    def update_many(self, records: list):
+        with self.lock:
+            for record in records:
+                value = record.get("inflation_prediction")
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    continue
+                scenario = record["scenario"]
+                self._stats(self.by_scenario, scenario).update(float(value))
+                # в снимке хранилища у записей без additional_data стоит NaN
+                extra = record.get("additional_data")
+                extra = extra if isinstance(extra, dict) else {}
+                for key in self.slice_keys:
+                    if key in extra:
+                        self._stats(self.by_slice, (scenario, key, str(extra[key]))).update(float(value))
+
+    def rebuild(self, df: pd.DataFrame):
+        """Пересчитывает агрегаты с нуля по снимку хранилища (ResponseStore.snapshot)"""
+        with self.lock:
+            self.by_scenario = {}
+            self.by_slice = {}
+        self.update_many(df.to_dict("records"))
+
+    def summary(self, scenario: str = None, slice_key: str = None) -> dict:
+        """
+        Статистика по всем сценариям (или одному) в виде словаря для JSON.
+        С slice_key дополнительно возвращается разбивка по значениям этого ключа.
+        """
+        with self.lock:
+            scenarios = [scenario] if scenario is not None else list(self.by_scenario)
+            result = {}
+            for name in scenarios:
+                if name not in self.by_scenario:
+                    continue
+                result[name] = self.by_scenario[name].to_dict()
+                if slice_key is not None:
+                    result[name]["slices"] = {
+                        value: stats.to_dict()
+                        for (s, key, value), stats in self.by_slice.items()
+                        if s == name and key == slice_key
+                    }
+            return result
+
+
+class AnswerCounts:
+    """
+    Число ответов каждой категории inflation_prediction по сценариям, дочитываемое из ResponseStore.tail.
+
+    Хранится водяной знак (сегмент журнала, смещение), поэтому refresh читает только записи,
+    пришедшие после прошлого вызова. Счетчики сегмента, на котором стоит водяной знак, ведутся
+    отдельно: если этот сегмент уже перенесен в Parquet, tail вернет его записи с начала, и они
+    пересчитываются без двойного учета.
+    """
+
+    def __init__(self, scenarios: list = None):
+        """scenarios - какие сценарии считать (по умолчанию все)"""
+        self.scenarios = None if scenarios is None else list(scenarios)
+        self.position = (0, 0)
+        self.closed = {}
+        self.current = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _add(target: dict, counts: dict):
+        for key, n in counts.items():
+            target[key] = target.get(key, 0) + n
+
+    def refresh(self, store) -> int:
+        """Дочитывает новые записи хранилища; возвращает их число"""
+        with self.lock:
+            segment, offset = self.position
+            df, position, restarted = store.tail(segment, offset)
+            if restarted:
+                self.current = {}
+            if segment < position[0]:
+                # сегмент водяного знака закрыт: его счетчики больше не пересчитываются
+                self._add(self.closed, self.current)
+                self.current = {}
+            if self.scenarios is not None:
+                df = df[df["scenario"].isin(self.scenarios)]
+            df = df.dropna(subset=["inflation_prediction"])
+            if len(df):
+                scores = df["inflation_prediction"].astype(int)
+                counts = df.groupby([df["segment"] == position[0], df["scenario"], scores]).size()
+                for (is_current, scenario, score), n in counts.items():
+                    self._add(self.current if is_current else self.closed, {(scenario, score): int(n)})
+            self.position = position
+            return len(df)
+
+    def counts(self, scenario: str, categories: list) -> pd.Series:
+        """Число ответов по категориям categories (в их порядке)"""
+        with self.lock:
+            return pd.Series(
+                [self.closed.get((scenario, c), 0) + self.current.get((scenario, c), 0) for c in categories],
+                index=pd.Index(categories, name="inflation_score")
+            )
@@ -1,10 +1,10 @@
 from pydantic import BaseModel
-import pandas as pd
 import os
-from typing import Dict, Any
-import fcntl
 from datetime import datetime
+from typing import Dict, Any, List
 from fastapi import FastAPI
+from storage import ResponseStore, GroupCommitWriter
+from aggregates import SurveyAggregates
 
 app = FastAPI()
 
@@ -16,54 +16,47 @@ class ResponseData(BaseModel):
     participant_id: str - уникальный идентификатор участника опроса 
     scenario: str - описание сценария шока (например, "НДС +2%", "Ключевая ставка +1%")
     inflation_prediction: float - прогноз инфляции от участника в числовом виде
-    timestamp: str = None - время ответа (опциональное, если не передано - добавится автоматически)
+    timestamp: datetime = None - время ответа в ISO 8601 (опциональное, если не передано - добавится автоматически)
     additional_data: Dict[str, Any] = {} - дополнительные метаданные (возраст участника, регион и т.д.)
     """
     participant_id: str
     scenario: str
     inflation_prediction: float
-    timestamp: str = None
+    timestamp: datetime = None
     additional_data: Dict[str, Any] = {}
 
-DATA_FILE = "data/responses.parquet"
+DATA_DIR = "data"
+DATA_FILE = "data/responses.parquet"  # файл старого формата, подключается к хранилищу как есть
 
-def ensure_data_dir():
-    """Создает директорию data если она не существует"""
-    os.makedirs("data", exist_ok=True)
+# Журнал + фоновая компакция в Parquet: запись не зависит от объема уже собранных данных
+store = ResponseStore(DATA_DIR, legacy_file=DATA_FILE)
+# Записи конкурентных запросов объединяются в пачки: один fsync на пачку
+writer = GroupCommitWriter(store)
 
-def append_to_parquet(data: dict):
-    """Добавляет данные в parquet файл с file-locking"""
-    ensure_data_dir()
-    
-    # Добавляем timestamp если не указан
-    if not data.get('timestamp'):
-        data['timestamp'] = datetime.now().isoformat()
-    
-    df_new = pd.DataFrame([data])
-    
-    # File locking для безопасной записи
-    with open(DATA_FILE + ".lock", "w") as lock_file:
-        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX) #ставит блокировку - только один процесс может писать; предотвращает повреждение файла при одновременных записях
-        
-        try:
-            if os.path.exists(DATA_FILE):
-                # Читаем существующие данные и добавляем новые
-                df_existing = pd.read_parquet(DATA_FILE)
-                df_combined = pd.concat([df_existing, df_new], ignore_index=True)
-            else:
-                df_combined = df_new
-            
-            # Сохраняем обновленные данные
-            df_combined.to_parquet(DATA_FILE, index=False)
-            
-        finally: # finally гарантирует снятие блокировки даже при ошибке
-            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+# Ключи additional_data, по которым /stats дополнительно разбивает статистику (через запятую)
+STATS_SLICE_KEYS = [key for key in os.environ.get("STATS_SLICE_KEYS", "").split(",") if key]
+aggregates = SurveyAggregates(slice_keys=STATS_SLICE_KEYS)
+
+@app.on_event("startup")
+async def start_store():
+    """Восстанавливает агрегаты по хранилищу, запускает компакцию журнала и групповую запись"""
+    aggregates.rebuild(store.snapshot())
+    store.subscribe(aggregates.update_many)
+    store.start()
+    await writer.start()
+
+@app.on_event("shutdown")
+async def stop_store():
+    """Дописывает очередь, останавливает компакцию и сбрасывает журнал на диск"""
+    await writer.stop()
+    store.stop()
 
 @app.post("/response")
-def save_response(response: ResponseData):
+async def save_response(response: ResponseData):
     """Сохраняет ответ участника опроса и передает данные в модель"""
     data = response.dict()
-    append_to_parquet(data)
+    # ответ возвращается только после того, как запись сброшена на диск
+    await writer.submit([data])
         
     # Подготавливаем данные для модели
     model_input = {
@@ -74,6 +67,20 @@ def save_response(response: ResponseData):
         
     return model_input
 
+@app.post("/responses/batch")
+async def save_responses(responses: List[ResponseData]):
+    """Сохраняет сразу много ответов (например, выгрузку симулированной панели)"""
+    saved = await writer.submit([response.dict() for response in responses])
+    return {"saved": len(saved)}
+
+@app.get("/stats")
+def get_stats(scenario: str = None, slice_key: str = None):
+    """
+    Текущая статистика inflation_prediction по сценариям: count, mean, variance, квантили, гистограмма.
+    Считается по мере поступления ответов, хранилище не перечитывается.
+    """
+    return aggregates.summary(scenario, slice_key)
+
 @app.get("/health")
 def health_check():
     """Проверка работоспособности API"""
@@ -1,58 +1,118 @@
-import streamlit as st
+import os
+import uuid
 import pandas as pd
+import streamlit as st
+from aggregates import AnswerCounts
+from results_store import RunResultsStore, vciom_benchmark
+from score_parser import option_labels
+from storage import ResponseStore
+
+# Ответы респондентов пишутся в ResponseStore (журнал + компакция в Parquet), как и в api.py
+SURVEY_DATA_DIR = os.environ.get("SURVEY_DATA_DIR", "survey_data")
+# Симулированные ответы - прогоны results_store.RunResultsStore
+RESULTS_ROOT = os.environ.get("RESULTS_ROOT", "results")
+# Сценарий ResponseStore для каждого вопроса
+survey_scenarios = {1: "survey_q1", 2: "survey_q2"}
+
+questions = {
+    1: "1. Как, на Ваш взгляд, будут меняться цены на основные потребительские товары и услуги в ближайшие 1–2 месяца?",
+    2: "2. Как бы Вы оценили рост цен (инфляцию) в течение последнего месяца–двух?"
+}
+
+
+@st.cache_resource
+def get_store() -> ResponseStore:
+    """Одно хранилище на процесс Streamlit: все сессии пишут в один журнал"""
+    store = ResponseStore(SURVEY_DATA_DIR)
+    store.start()
+    return store
+
+
+@st.cache_resource
+def get_counts() -> AnswerCounts:
+    """Счетчики ответов, общие для всех сессий; каждый rerun дочитывает только новые записи"""
+    return AnswerCounts(list(survey_scenarios.values()))
+
+
+@st.cache_data
+def simulated_shares(q_num: int, index_mtime: float) -> pd.DataFrame:
+    """Доли ответов каждого прогона; пересчитываются только при изменении индекса прогонов (index_mtime)"""
+    try:
+        return RunResultsStore(RESULTS_ROOT).shares(q_num)
+    except KeyError:
+        return pd.DataFrame()
+
+
+def survey_page():
+    st.title("Оценка инфляционных ожиданий")
+    st.markdown("""
+    Пожалуйста, ответьте на два вопроса:
+    1. **Как, на Ваш взгляд, будут меняться цены на основные потребительские товары и услуги в ближайшие один–два месяца?**
+    2. **Как бы Вы оценили рост цен (инфляцию) в течение последнего месяца–двух?**
+    """)
+
+    # Создаём форму, чтобы при сабмите всё обрабатывалось разом.
+    # Варианты ответа - те же, что у ВЦИОМ и в промптах агента (score_parser.option_labels)
+    with st.form(key="inflation_survey", clear_on_submit=True):
+        answers = {q_num: st.radio(text, options=list(option_labels[q_num])) for q_num, text in questions.items()}
+        submitted = st.form_submit_button("Отправить ответы")
+
+    if submitted:
+        participant_id = str(uuid.uuid4())
+        get_store().append_many([{
+            "participant_id": participant_id,
+            "scenario": survey_scenarios[q_num],
+            "inflation_prediction": option_labels[q_num][answer],
+            "additional_data": {"q_num": q_num, "answer": answer, "source": "streamlit"}
+        } for q_num, answer in answers.items()])
+        st.success("Спасибо! Ваши ответы сохранены.")
+
+
+def results_table(q_num: int, run_ids: list) -> tuple:
+    """Доли ответов респондентов, симуляции (среднее по выбранным прогонам) и ВЦИОМ, %"""
+    categories = list(option_labels[q_num].values())
+    counts = get_counts().counts(survey_scenarios[q_num], categories)
+    rows = {"Респонденты": counts / counts.sum() * 100 if counts.sum() else counts * 0.0}
+
+    index_path = os.path.join(RESULTS_ROOT, "runs.parquet")
+    shares = simulated_shares(q_num, os.path.getmtime(index_path) if os.path.exists(index_path) else 0.0)
+    selected = [run_id for run_id in run_ids if run_id in shares.index]
+    if selected:
+        rows["Симуляция"] = shares.loc[selected, categories].mean()
+    rows["ВЦИОМ"] = pd.Series([vciom_benchmark[q_num][c] for c in categories], index=categories)
+
+    table = pd.DataFrame(rows).T
+    table.columns = list(option_labels[q_num])
+    return table, int(counts.sum())
+
+
+def results_page():
+    st.title("Результаты опроса")
+    live = st.sidebar.checkbox("Обновлять автоматически", value=True)
+
+    index_path = os.path.join(RESULTS_ROOT, "runs.parquet")
+    runs = RunResultsStore(RESULTS_ROOT).runs() if os.path.exists(index_path) else pd.DataFrame(columns=["run_id"])
+    run_ids = st.sidebar.multiselect("Прогоны симуляции", sorted(runs["run_id"].unique()),
+                                     default=sorted(runs["run_id"].unique()))
+
+    @st.fragment(run_every=5 if live else None)
+    def render():
+        # читаются только записи, пришедшие после прошлого rerun
+        get_counts().refresh(get_store())
+        for q_num, text in questions.items():
+            table, n = results_table(q_num, run_ids)
+            st.subheader(text)
+            st.caption(f"Ответов респондентов: {n}")
+            st.bar_chart(table.T, stack=False)
+            st.dataframe(table.round(1))
+
+    render()
+
 
 # Заголовок страницы
 st.set_page_config(page_title="Опрос по инфляционным ожиданиям", layout="centered")
-st.title("Оценка инфляционных ожиданий")
-
-st.markdown("""
-Пожалуйста, ответьте на два вопроса:
-1. **Как, на Ваш взгляд, будут меняться цены на основные потребительские товары и услуги в ближайшие один–два месяца?**  
-2. **Как бы Вы оценили рост цен (инфляцию) в течение последнего месяца–двух?**
-""")
-
-# Создаём форму, чтобы при сабмите всё обрабатывалось разом
-with st.form(key="inflation_survey"):
-    # Вопрос 1: ожидания
-    expectations = st.radio(
-        "1. Как, на Ваш взгляд, будут меняться цены в ближайшие 1–2 месяца?",
-        options=[
-            "Сильно вырастут (>5%)",
-            "Умеренно вырастут (1–5%)",
-            "Останутся примерно на том же уровне",
-            "Умеренно снизятся (1–5%)",
-            "Сильно снизятся (>5%)"
-        ]
-    )
-
-    # Вопрос 2: ретроспектива
-    retrospective = st.radio(
-        "2. Как бы Вы оценили рост цен за последний 1–2 месяца?",
-        options=[
-            "Сильно выросли (>5%)",
-            "Умеренно выросли (1–5%)",
-            "Остались примерно на том же уровне",
-            "Умеренно снизились (1–5%)",
-            "Сильно снизились (>5%)"
-        ]
-    )
-
-    # Кнопка отправки
-    submitted = st.form_submit_button("Отправить ответы")
-
-if submitted:
-    # 1) Подготовка данных
-    responses = {
-        "expectations": expectations,
-        "retrospective": retrospective
-    }
-
-    # 3) (Опционально) Сохранение ответов
-    df = pd.DataFrame([{
-        "timestamp": pd.Timestamp.now(),
-        "expectations": expectations,
-        "retrospective": retrospective,
-    }])
-    # Добавляем к файлу survey_results.csv
-    df.to_csv("survey_results.csv", mode="a", index=False, header=not st.experimental_get_query_params().get("file_exists", False))
-    # После первого сохранения можно передавать в query params флаг file_exists=True
+page = st.sidebar.radio("Страница", ["Опрос", "Результаты"])
+if page == "Опрос":
+    survey_page()
+else:
+    results_page()
@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
+import anthropic
+from score_parser import option_labels
+
+
+def make_usage(input_tokens: int = 0, output_tokens: int = 0, **cache_tokens) -> SimpleNamespace:
+    """usage в том же виде, что message.usage у Anthropic"""
+    return SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                           cache_read_input_tokens=cache_tokens.get("cache_read_input_tokens", 0),
+                           cache_creation_input_tokens=cache_tokens.get("cache_creation_input_tokens", 0))
+
+
+def system_text(system) -> str:
+    """Текст системного промпта: строка или список блоков {"type": "text", "text": ...}"""
+    if isinstance(system, str):
+        return system
+    return "\n".join(block["text"] for block in system)
+
+
+class LLMBackend:
+    """
+    Интерфейс генерации для AgentEngine.
+
+    request - словарь в формате Anthropic Messages API: model, max_tokens, temperature, system, messages.
+    Все методы возвращают пару (text, usage), где usage содержит input_tokens, output_tokens
+    и (если бэкенд их знает) cache_read_input_tokens / cache_creation_input_tokens.
+    """
+
+    def generate(self, request: dict):
+        raise NotImplementedError
+
+    def generate_until(self, request: dict, stop):
+        """
+        Генерация, которую можно прервать: stop(text) вызывается на накопленном тексте
+        после каждого перевода строки. По умолчанию генерируется весь ответ.
+        """
+        return self.generate(request)
+
+    async def agenerate(self, request: dict):
+        return await asyncio.to_thread(self.generate, request)
+
+    def generate_batch(self, requests: list) -> list:
+        return [self.generate(request) for request in requests]
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        """Пауза перед повтором запроса или None, если ошибку повторять не нужно"""
+        return None
+
+    def close(self):
+        pass
+
+
+class AnthropicBackend(LLMBackend):
+    """
+    Anthropic Messages API: один клиент (с пулом HTTP-соединений) на все запросы.
+    base_url - другой адрес API (например, mock_llm_server для замеров),
+    sdk_max_retries - собственные повторы клиента anthropic поверх повторов AgentEngine
+    """
+
+    # HTTP-статусы, после которых запрос имеет смысл повторить: rate limit и перегрузка API
+    retryable_statuses = (429, 500, 503, 529)
+
+    def __init__(self, api_key: str, batch_workers: int = 8, base_url: str = None, sdk_max_retries: int = 2):
+        self.api_key = api_key
+        self.client_options = dict(api_key=api_key, base_url=base_url, max_retries=sdk_max_retries)
+        self.client = anthropic.Anthropic(**self.client_options)
+        self.async_client = None
+        self.batch_workers = batch_workers
+
+    def generate(self, request: dict):
+        message = self.client.messages.create(**request)
+        return message.content[0].text, message.usage
+
+    def generate_until(self, request: dict, stop):
+        chunks = []
+        stopped = False
+        with self.client.messages.stream(**request) as stream:
+            for delta in stream.text_stream:
+                chunks.append(delta)
+                # проверяем только когда пришел конец строки: до этого ответ мог быть не дописан
+                if "\n" in delta and stop("".join(chunks)):
+                    stopped = True
+                    break
+            # выход из with закрывает соединение, и API перестает генерировать токены
+            usage = stream.current_message_snapshot.usage
+        text = "".join(chunks)
+        if stopped:
+            # при досрочной остановке финальный message_delta не приходит, и в снимке остается
+            # output_tokens из message_start (обычно 1): оцениваем расход по полученному тексту, ~3 символа на токен
+            usage.output_tokens = max(usage.output_tokens or 0, len(text) // 3)
+        return text, usage
+
+    async def agenerate(self, request: dict):
+        if self.async_client is None:
+            self.async_client = anthropic.AsyncAnthropic(**self.client_options)
+        message = await self.async_client.messages.create(**request)
+        return message.content[0].text, message.usage
+
+    def generate_batch(self, requests: list) -> list:
+        # у Messages API нет синхронного пакетного вызова, поэтому пачка - это параллельные запросы
+        with ThreadPoolExecutor(max_workers=self.batch_workers) as executor:
+            return list(executor.map(self.generate, requests))
+
+    def retry_delay(self, error: Exception, attempt: int) -> float:
+        if isinstance(error, anthropic.APIStatusError):
+            if error.status_code not in self.retryable_statuses:
+                return None
+            retry_after = error.response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return float(retry_after)
+                except ValueError:
+                    pass
+        elif not isinstance(error, anthropic.APIConnectionError):
+            return None
+        # экспоненциальная пауза с джиттером: 1, 2, 4, ... секунд, не больше минуты
+        return min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+class HFBackend(LLMBackend):
+    """
+    Локальная модель transformers (например, IlyaGusev/saiga_mistral_7b_lora из llm_opensource.ipynb).
+
+    Одиночные запросы из разных потоков (runner.run_concurrent) собираются в пачки до batch_size
+    за max_delay_ms и генерируются одним вызовом model.generate с паддингом слева,
+    поэтому граф агента менять не нужно: достаточно max_workers >= batch_size.
+    max_new_tokens ограничивает max_tokens запроса (1024 у AgentEngine слишком долго для CPU).
+    """
+
+    def __init__(self, model, tokenizer, batch_size: int = 16, max_delay_ms: float = 20.0,
+                 max_new_tokens: int = 512, top_p: float = 0.9, repetition_penalty: float = 1.1):
+        self.model = model
+        self.tokenizer = tokenizer
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        # при пакетной генерации decoder-only модели промпты выравниваются по правому краю
+        self.tokenizer.padding_side = "left"
+        self.batch_size = batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.max_new_tokens = max_new_tokens
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    @staticmethod
+    def format_prompt(request: dict) -> str:
+        """Промпт в формате Saiga/Mistral"""
+        prompt = f"<s>system\n{system_text(request.get('system', ''))}</s>\n"
+        for message in request["messages"]:
+            role = "bot" if message["role"] == "assistant" else message["role"]
+            prompt += f"<s>{role}\n{message['content']}</s>\n"
+        return prompt + "<s>bot\n"
+
+    def generate(self, request: dict):
+        future = Future()
+        self.queue.put((request, future))
+        return future.result()
+
+    def generate_batch(self, requests: list) -> list:
+        """Генерирует пачку за один вызов model.generate на каждую пару (max_tokens, temperature)"""
+        results = [None] * len(requests)
+        groups = {}
+        for i, request in enumerate(requests):
+            max_tokens = min(request.get("max_tokens", self.max_new_tokens), self.max_new_tokens)
+            groups.setdefault((max_tokens, request.get("temperature", 0.7)), []).append(i)
+        for (max_tokens, temperature), positions in groups.items():
+            for i, result in zip(positions, self._generate_padded([requests[i] for i in positions],
+                                                                  max_tokens, temperature)):
+                results[i] = result
+        return results
+
+    def _generate_padded(self, requests: list, max_tokens: int, temperature: float) -> list:
+        import torch
+
+        prompts = [self.format_prompt(request) for request in requests]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False)
+        inputs = inputs.to(self.model.device)
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                top_p=self.top_p,
+                repetition_penalty=self.repetition_penalty,
+                do_sample=temperature > 0,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id
+            )
+        generated = outputs[:, inputs["input_ids"].shape[1]:]
+        texts = self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+        input_tokens = inputs["attention_mask"].sum(dim=1).tolist()
+        output_tokens = (generated != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        return [
+            (text.split("</s>")[0].strip(), make_usage(int(n_in), int(n_out)))
+            for text, n_in, n_out in zip(texts, input_tokens, output_tokens)
+        ]
+
+    def _run(self):
+        """Фоновый поток: собирает очередь запросов в пачки и генерирует их"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                results = self.generate_batch([request for request, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def close(self):
+        self.queue.put(None)
+        self.worker.join()
+
+
+class StubBackend(LLMBackend):
+    """
+    Детерминированный бэкенд для тестов и замеров без API: ответ зависит только от запроса и seed.
+    latency - задержка на запрос, latency_per_token - дополнительно на каждый токен ответа.
+    """
+
+    def __init__(self, latency: float = 0.0, latency_per_token: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.seed = seed
+
+    def complete(self, request: dict):
+        """Ответ и usage без задержки"""
+        prompt = system_text(request.get("system", "")) + "\n" + "\n".join(
+            system_text(message["content"]) for message in request["messages"]
+        )
+        digest = hashlib.sha256(
+            json.dumps([request, self.seed], ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        ).digest()
+        # вопрос 2 задается по шкале от 0 до 3, остальные - по шкале вопроса 1
+        labels = list(option_labels[2 if "от 0 до 3" in prompt else 1].items())
+        label, score = labels[digest[0] % len(labels)]
+        text = f"Если подумать о ценах у меня в городе, я бы сказал так.\nОтвет: «{label}» - {score}\n"
+        return text, make_usage(len(prompt) // 3, len(text) // 3)
+
+    def generate(self, request: dict):
+        text, usage = self.complete(request)
+        time.sleep(self.latency + self.latency_per_token * usage.output_tokens)
+        return text, usage
+
+    async def agenerate(self, request: dict):
+        text, usage = self.complete(request)
+        await asyncio.sleep(self.latency + self.latency_per_token * usage.output_tokens)
+        return text, usage
@@ -0,0 +1,97 @@
+"""
+Нагрузочный тест API опроса: запросов в секунду при 1, 4 и 16 одновременных клиентах.
+
+Поднимает локальный uvicorn с api:app во временной папке (данные не попадают в ./data)
+и гоняет POST /response (и, с флагом --batch, POST /responses/batch).
+
+    python bench_api.py --requests 2000 --clients 1 4 16
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+
+def make_payload(i: int) -> dict:
+    return {
+        "participant_id": f"bench-{i}",
+        "scenario": ["НДС +2%", "Ключевая ставка +1%"][i % 2],
+        "inflation_prediction": float(i % 6),
+        "additional_data": {"AGE": 18 + i % 60}
+    }
+
+
+def start_server(port: int, workdir: str, app: str = "api:app", env: dict = None) -> subprocess.Popen:
+    """Запускает uvicorn и ждет, пока /health начнет отвечать"""
+    env = {**os.environ, **(env or {}), "PYTHONPATH": os.path.dirname(os.path.abspath(__file__))}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/health")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("uvicorn не запустился")
+
+
+async def run_clients(url: str, clients: int, total: int, batch_size: int, latencies: list = None) -> float:
+    """
+    Отправляет total ответов силами clients параллельных клиентов, возвращает запросов/сек.
+    Если передан список latencies, в него дописывается время каждого запроса (сек)
+    """
+    counter = iter(range(0, total, batch_size))
+
+    async def client_loop(client: httpx.AsyncClient):
+        for start in counter:
+            started = time.perf_counter()
+            if batch_size == 1:
+                response = await client.post(f"{url}/response", json=make_payload(start))
+            else:
+                response = await client.post(
+                    f"{url}/responses/batch",
+                    json=[make_payload(i) for i in range(start, min(start + batch_size, total))]
+                )
+            response.raise_for_status()
+            if latencies is not None:
+                latencies.append(time.perf_counter() - started)
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=clients)) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(clients)))
+        return (total + batch_size - 1) // batch_size / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="сколько ответов отправить на каждый замер")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch", type=int, default=0, help="размер пачки для /responses/batch (0 - не замерять)")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(args.port, workdir)
+        url = f"http://127.0.0.1:{args.port}"
+        try:
+            for clients in args.clients:
+                rps = asyncio.run(run_clients(url, clients, args.requests, 1))
+                print(f"/response          клиентов={clients:<3} {rps:8.1f} запросов/сек")
+                if args.batch:
+                    rps = asyncio.run(run_clients(url, clients, args.requests, args.batch))
+                    print(f"/responses/batch   клиентов={clients:<3} {rps:8.1f} запросов/сек "
+                          f"({rps * args.batch:.0f} ответов/сек)")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
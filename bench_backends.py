@@ -0,0 +1,59 @@
+"""
+Пропускная способность бэкендов генерации в персонах/сек (полный граф: search + финальный ответ).
+
+    python bench_backends.py --backend stub --latency 0.05 --workers 1 8 32
+    python bench_backends.py --backend hf --model IlyaGusev/saiga_mistral_7b_lora --batch-size 1 8 16
+
+Для hf каждая комбинация batch_size гоняется с max_workers = 2 * batch_size,
+чтобы пачки успевали заполняться запросами из параллельных строк.
+"""
+import argparse
+import time
+import pandas as pd
+from agent import AgentEngine
+from backends import HFBackend, StubBackend
+from runner import run_concurrent
+
+
+def measure(backend, sample_df: pd.DataFrame, max_workers: int) -> float:
+    """Прогоняет выборку через AgentEngine с данным бэкендом, возвращает персон/сек"""
+    engine = AgentEngine(backend=backend)
+    started = time.perf_counter()
+    run_concurrent(None, sample_df, "Как изменятся цены в ближайшие месяцы? Ответь числом от 0 до 5.", 1,
+                   max_workers=max_workers, engine=engine)
+    return len(sample_df) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["stub", "hf"], default="stub")
+    parser.add_argument("--sample", default="df1.csv")
+    parser.add_argument("--personas", type=int, default=64)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32], help="max_workers для stub")
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка stub на запрос, сек")
+    parser.add_argument("--model", default="IlyaGusev/saiga_mistral_7b_lora")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1, 8, 16], help="размеры пачки для hf")
+    parser.add_argument("--max-tokens", type=int, default=64, help="длина ответа для hf")
+    args = parser.parse_args()
+
+    sample_df = pd.read_csv(args.sample).head(args.personas)
+    if args.backend == "stub":
+        for workers in args.workers:
+            rate = measure(StubBackend(latency=args.latency), sample_df, workers)
+            print(f"stub  workers={workers:<3} {rate:8.1f} персон/сек")
+        return
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    model = AutoModelForCausalLM.from_pretrained(args.model)
+    tokenizer = AutoTokenizer.from_pretrained(args.model, use_fast=False)
+    for batch_size in args.batch_size:
+        backend = HFBackend(model, tokenizer, batch_size=batch_size, max_new_tokens=args.max_tokens)
+        try:
+            rate = measure(backend, sample_df, 2 * batch_size)
+        finally:
+            backend.close()
+        print(f"hf    batch={batch_size:<3} {rate:8.2f} персон/сек")
+
+
+if __name__ == "__main__":
+    main()
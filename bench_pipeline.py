@@ -0,0 +1,246 @@
+"""
+Сквозной замер производительности конвейера без расхода кредитов API.
+
+Этапы:
+    sample  - построение стратифицированной выборки (make_sample.dosample)
+    agent   - граф агента (search + финальный ответ) против mock_llm_server вместо Messages API
+    parse   - извлечение оценок (score_parser.parse_scores)
+    mlflow  - логирование модели и ответов (save_mlflow.save_to_mlflow) во временную папку
+    api     - прием ответов через POST /response (api.py)
+
+Для каждого этапа: строк/сек, p50/p95/p99 задержки одной операции, пиковая память процесса.
+Результат сохраняется в JSON; --compare сравнивает его с прошлым замером.
+
+    python bench_pipeline.py --rows 311 --latency 0.5 --rate-429 0.02 --rate-529 0.01
+    python bench_pipeline.py --compare bench_results/<прошлый замер>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import httpx
+import numpy as np
+import pandas as pd
+from agent import Agent, AgentEngine
+from backends import AnthropicBackend
+from bench_api import run_clients, start_server
+from make_sample import dosample
+from runner import RateLimiter
+from score_parser import parse_scores
+
+QUERY = """Как, на Ваш взгляд, будут меняться цены на основные потребительские товары и услуги в ближайшие один-два месяца? Оцени рост цен числом от 0 до 5.
+К примеру, твой ответ должен выглядеть: «Ответ: «Останутся на нынешнем уровне» - 3»"""
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса (на Linux ru_maxrss в КБ, на macOS - в байтах)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if platform.system() == "Darwin" else peak / 2 ** 10
+
+
+def stage_result(rows: int, seconds: float, latencies=None, **extra) -> dict:
+    result = {"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds else None}
+    if latencies is not None and len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        result.update(p50=float(p50), p95=float(p95), p99=float(p99))
+    result["peak_rss_mb"] = peak_rss_mb()
+    result.update(extra)
+    return result
+
+
+def bench_sample(df: pd.DataFrame, sample_size: int, repeats: int) -> tuple:
+    latencies = []
+    for seed in range(repeats):
+        started = time.perf_counter()
+        sample_df = dosample(df, 100, seed, strata=('age_group', 'SEX'), sample_size=sample_size).create_sample()
+        latencies.append(time.perf_counter() - started)
+    return sample_df, stage_result(sample_size * repeats, sum(latencies), latencies)
+
+
+def bench_agent(sample_df: pd.DataFrame, base_url: str, max_workers: int, stream_final: bool) -> tuple:
+    """Полный граф на каждую строку; задержка - время engine.answer одной строки"""
+    engine = AgentEngine(
+        backend=AnthropicBackend("mock", base_url=base_url, sdk_max_retries=0),
+        limiter=RateLimiter(100000, 10 ** 9),
+        stream_final=stream_final
+    )
+
+    def process(row):
+        started = time.perf_counter()
+        result = engine.answer(QUERY, row, 1)
+        return result, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process, [row for _, row in sample_df.iterrows()]))
+    seconds = time.perf_counter() - started
+    server = httpx.get(f"{base_url}/stats").json()
+    responses = [(result["response"], result["inflation_score"]) for result, _ in results]
+    return responses, stage_result(
+        len(sample_df), seconds, [latency for _, latency in results],
+        llm_requests=server["requests"], errors_429=server["errors_429"], errors_529=server["errors_529"],
+        failed_rows=sum(response.startswith("Ошибка") for response, _ in responses),
+        usage=engine.usage_stats()
+    )
+
+
+def bench_parse(responses: list, rows: int) -> dict:
+    texts = [response for response, _ in responses] * (rows // len(responses) + 1)
+    texts = texts[:rows]
+    started = time.perf_counter()
+    parse_scores(texts, 1)
+    return stage_result(rows, time.perf_counter() - started)
+
+
+def bench_mlflow(responses: list, workdir: str) -> dict:
+    """save_to_mlflow пишет в ./mlruns, поэтому выполняется из временной папки"""
+    try:
+        from save_mlflow import save_to_mlflow, InflationAgentWrapper, model_code_paths
+    except ImportError as e:
+        return {"skipped": str(e)}
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        Agent.save_responses_to_csv(responses, "responses.csv")
+        started = time.perf_counter()
+        save_to_mlflow({
+            "experiment_name": "bench",
+            "run_name": "bench_pipeline",
+            "artifact_path": "model",
+            "python_model": InflationAgentWrapper(),
+            "code_paths": model_code_paths,
+            "metrics_csv": "responses.csv",
+            "metrics_artifact_path": "responses"
+        })
+        seconds = time.perf_counter() - started
+    except Exception as e:
+        # замер остальных этапов не должен зависеть от настроек MLflow в окружении
+        return {"skipped": f"{type(e).__name__}: {str(e).splitlines()[0]}"}
+    finally:
+        os.chdir(cwd)
+    return stage_result(len(responses), seconds, [seconds])
+
+
+def bench_ingest(port: int, workdir: str, requests: int, clients: int) -> dict:
+    server = start_server(port, workdir)
+    try:
+        latencies = []
+        started = time.perf_counter()
+        asyncio.run(run_clients(f"http://127.0.0.1:{port}", clients, requests, 1, latencies))
+        return stage_result(requests, time.perf_counter() - started, latencies)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current: dict, baseline: dict):
+    """Печатает отношение текущего замера к прошлому (>1 по rows_per_sec и <1 по p95 - лучше)"""
+    print(f"\nСравнение с {baseline.get('version')} ({baseline.get('timestamp')}):")
+    for stage, result in current["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or "rows_per_sec" not in result or "rows_per_sec" not in before:
+            continue
+        line = f"  {stage:<7} строк/сек x{result['rows_per_sec'] / before['rows_per_sec']:.2f}"
+        if result.get("p95") and before.get("p95"):
+            line += f"   p95 x{result['p95'] / before['p95']:.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default="df1.csv")
+    parser.add_argument("--rows", type=int, default=311, help="размер выборки для графа агента")
+    parser.add_argument("--sample-repeats", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--stream-final", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.5, help="медиана задержки mock-сервера, сек")
+    parser.add_argument("--latency-sigma", type=float, default=0.3)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-529", type=float, default=0.0)
+    parser.add_argument("--retry-after", default="0.5")
+    parser.add_argument("--parse-rows", type=int, default=100000)
+    parser.add_argument("--api-requests", type=int, default=2000)
+    parser.add_argument("--api-clients", type=int, default=16)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["sample", "agent", "parse", "mlflow", "api"])
+    parser.add_argument("--mock-port", type=int, default=8766)
+    parser.add_argument("--api-port", type=int, default=8765)
+    parser.add_argument("--output", default=None, help="по умолчанию bench_results/<время>.json")
+    parser.add_argument("--compare", default=None, help="JSON прошлого замера")
+    args = parser.parse_args()
+
+    report = {
+        "version": git_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "stages": {}
+    }
+    df = pd.read_csv(args.data, index_col=0)
+    sample_df = df.sample(args.rows, replace=len(df) < args.rows, random_state=0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if "sample" not in args.skip:
+            sample_df, report["stages"]["sample"] = bench_sample(df, args.rows, args.sample_repeats)
+
+        responses = None
+        if "agent" not in args.skip:
+            mock = start_server(args.mock_port, workdir, "mock_llm_server:app", {
+                "MOCK_LATENCY_MEDIAN": str(args.latency),
+                "MOCK_LATENCY_SIGMA": str(args.latency_sigma),
+                "MOCK_RATE_429": str(args.rate_429),
+                "MOCK_RATE_529": str(args.rate_529),
+                "MOCK_RETRY_AFTER": args.retry_after
+            })
+            try:
+                responses, report["stages"]["agent"] = bench_agent(
+                    sample_df, f"http://127.0.0.1:{args.mock_port}", args.workers, args.stream_final
+                )
+            finally:
+                mock.terminate()
+                mock.wait()
+        if responses is None:
+            responses = [("Ответ: «Незначительно вырастут» - 4", 4)] * args.rows
+
+        if "parse" not in args.skip:
+            report["stages"]["parse"] = bench_parse(responses, args.parse_rows)
+        if "mlflow" not in args.skip:
+            report["stages"]["mlflow"] = bench_mlflow(responses, workdir)
+        if "api" not in args.skip:
+            report["stages"]["api"] = bench_ingest(args.api_port, workdir, args.api_requests, args.api_clients)
+
+    for stage, result in report["stages"].items():
+        if "skipped" in result:
+            print(f"{stage:<7} пропущен: {result['skipped']}")
+            continue
+        line = f"{stage:<7} {result['rows_per_sec']:10.1f} строк/сек"
+        if "p50" in result:
+            line += f"   p50={result['p50']:.4f} p95={result['p95']:.4f} p99={result['p99']:.4f} сек"
+        print(line + f"   пик памяти {result['peak_rss_mb']:.0f} МБ")
+
+    output = args.output or os.path.join("bench_results", f"{report['timestamp'].replace(':', '-')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты замера сохранены в файл: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
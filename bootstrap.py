@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+from make_sample import dosample
+
+# Возможные значения inflation_score для каждого вопроса
+score_categories = {1: [5, 4, 3, 2, 1, 0], 2: [3, 2, 1, 0]}
+
+
+def replicate_indices(sample_df: pd.DataFrame, n_replicates: int, strata=('age_group',), agemax: int = 100,
+                      weight: str = None, seed: int = None) -> np.ndarray:
+    """
+    Бутстрап-реплики выборки в виде массива позиций (iloc) формы (n_replicates, len(sample_df)).
+    Сам DataFrame не копируется: реплика r - это sample_df.iloc[indices[r]].
+
+    Args:
+        sample_df: выборка, по которой получены ответы (sample_df1 / sample_df2)
+        strata: признаки стратификации (как в make_sample.dosample); каждая реплика сохраняет
+            размеры страт исходной выборки. Пустой список - простой бутстрап.
+        weight: колонка весов; если задана, строки тянутся с вероятностью, пропорциональной весу
+            (внутри страт не стратифицируется)
+        seed: seed генератора numpy
+    """
+    rng = np.random.default_rng(seed)
+    n = len(sample_df)
+
+    if weight is not None:
+        cumulative = np.cumsum(sample_df[weight].to_numpy(dtype=np.float64))
+        draws = rng.random((n_replicates, n)) * cumulative[-1]
+        return np.searchsorted(cumulative, draws, side='right')
+
+    if not strata:
+        return rng.integers(0, n, size=(n_replicates, n))
+
+    sampler = dosample(sample_df, agemax, seed, strata=strata)
+    sampler.add_age_groups()
+    codes = sampler.df.groupby(sampler.strata, observed=True, dropna=False).ngroup().to_numpy()
+
+    # позиции, отсортированные по страте; для каждой позиции - начало и размер ее страты
+    order = np.argsort(codes, kind='stable')
+    sizes = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    column_strata = codes[order]
+    offsets = np.floor(rng.random((n_replicates, n)) * sizes[column_strata]).astype(np.int64)
+    return order[starts[column_strata] + offsets]
+
+
+def replicate_shares(scores, indices: np.ndarray, categories: list) -> np.ndarray:
+    """
+    Доли каждой категории ответа во всех репликах сразу.
+
+    Returns:
+        массив формы (n_replicates, len(categories))
+    """
+    scores = np.asarray(scores)
+    lookup = {value: i for i, value in enumerate(categories)}
+    codes = np.array([lookup.get(value, -1) for value in scores], dtype=np.int64)
+    if (codes < 0).any():
+        raise ValueError(f"В scores есть значения вне categories: {sorted(set(scores) - set(categories))}")
+
+    n_replicates, n = indices.shape
+    n_categories = len(categories)
+    flat = (np.arange(n_replicates)[:, None] * n_categories + codes[indices]).ravel()
+    counts = np.bincount(flat, minlength=n_replicates * n_categories).reshape(n_replicates, n_categories)
+    return counts / n
+
+
+def confidence_intervals(scores, indices: np.ndarray, categories: list, alpha: float = 0.05) -> pd.DataFrame:
+    """
+    Перцентильные доверительные интервалы долей ответов.
+
+    Returns:
+        DataFrame с индексом categories и колонками share (по исходной выборке),
+        mean, std, lower, upper (по репликам), в процентах
+    """
+    shares = replicate_shares(scores, indices, categories)
+    point = replicate_shares(scores, np.arange(len(np.asarray(scores)))[None, :], categories)[0]
+    lower, upper = np.quantile(shares, [alpha / 2, 1 - alpha / 2], axis=0)
+    return pd.DataFrame({
+        'share': point * 100,
+        'mean': shares.mean(axis=0) * 100,
+        'std': shares.std(axis=0, ddof=1) * 100,
+        'lower': lower * 100,
+        'upper': upper * 100
+    }, index=pd.Index(categories, name='inflation_score'))
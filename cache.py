@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class CacheMiss(KeyError):
+    """Ответа нет в кэше, а режим replay не разрешает обращаться к API"""
+
+
+class ResponseCache:
+    """
+    Персистентный кэш ответов LLM в SQLite.
+
+    Ключ - sha256 от полного запроса (model, system_prompt, user_prompt, temperature, max_tokens),
+    поэтому одинаковые вызовы при повторных прогонах ноутбука не идут в API.
+
+    Режимы:
+        "readwrite" - write-through: попадания отдаются из кэша, новые ответы записываются
+        "replay"    - только чтение: кэш не изменяется, промах не идет в API, а вызывает CacheMiss
+                      (повторный прогон полностью офлайн и детерминирован)
+        "off"       - кэш выключен
+
+    Вытеснение:
+        max_age_seconds - записи старше этого возраста считаются промахом и удаляются
+        max_entries / max_bytes - при превышении удаляются давно не использованные записи
+    """
+
+    modes = ("readwrite", "replay", "off")
+
+    def __init__(self, path: str = "cache/responses.sqlite", mode: str = "readwrite",
+                 max_entries: int = None, max_bytes: int = None, max_age_seconds: float = None):
+        if mode not in self.modes:
+            raise ValueError(f"Неизвестный режим кэша: {mode}. Допустимые: {self.modes}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # одно соединение на процесс, доступ из потоков runner сериализуется через lock
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str, temperature: float, max_tokens: int,
+                 draw: int = 0, stop_at_answer: int = None) -> str:
+        """
+        Хэш полного запроса к модели.
+        draw различает независимые попытки одного и того же запроса (несколько ответов одной персоны),
+        stop_at_answer - ответы, оборванные после итоговой строки (AgentEngine(stream_final=True)), и полные
+        """
+        request = {
+            "model": model,
+            "system_prompt": system_prompt,
+            "user_prompt": user_prompt,
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+        if draw:
+            request["draw"] = draw
+        if stop_at_answer is not None:
+            request["stop_at_answer"] = stop_at_answer
+        request = json.dumps(request, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str:
+        """Возвращает сохраненный ответ или None"""
+        if self.mode == "off":
+            return None
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age_seconds is not None and now - row[1] > self.max_age_seconds:
+                if self.mode == "readwrite":
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode == "readwrite":
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def require(self, key: str) -> str:
+        """Как get, но в режиме replay промах вызывает CacheMiss вместо обращения к API"""
+        response = self.get(key)
+        if response is None and self.mode == "replay":
+            raise CacheMiss(f"Нет ответа в кэше (режим replay): {key}")
+        return response
+
+    def put(self, key: str, response: str):
+        """Сохраняет ответ (только в режиме readwrite)"""
+        if self.mode != "readwrite":
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            self.writes += 1
+            self._evict()
+
+    def _evict(self):
+        """Удаляет давно не использованные записи сверх лимитов max_entries / max_bytes"""
+        if self.max_entries is not None:
+            self.conn.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entries,))
+        if self.max_bytes is not None:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                # накопленная сумма размеров от самых свежих записей к самым старым
+                self.conn.execute("""
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS running
+                            FROM responses
+                        ) WHERE running > ?
+                    )""", (self.max_bytes,))
+
+    def purge_expired(self):
+        """Удаляет все записи старше max_age_seconds"""
+        if self.max_age_seconds is None or self.mode != "readwrite":
+            return
+        with self.lock:
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_seconds,))
+
+    def stats(self) -> dict:
+        """Счетчики попаданий/промахов и размер кэша"""
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+            "bytes": size
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+from bootstrap import score_categories
+from make_sample import dosample
+
+# Признаки, по маргиналам которых выборка калибруется к генеральной совокупности
+rake_columns = ('age_group', 'SEX', 'FO', 'TIP')
+
+
+def join_scores(sample_df: pd.DataFrame, responses) -> pd.DataFrame:
+    """
+    Присоединяет оценки к демографии выборки (по позиции строки).
+
+    Args:
+        responses: список пар (response, inflation_score) как у runner.run_concurrent,
+            DataFrame с колонкой inflation_score (например, из файла Agent.save_responses_to_csv) или массив оценок
+    """
+    if isinstance(responses, pd.DataFrame):
+        scores = responses['inflation_score'].to_numpy()
+    elif len(responses) and isinstance(responses[0], (tuple, list)):
+        scores = np.array([score for _, score in responses])
+    else:
+        scores = np.asarray(responses)
+    if len(scores) != len(sample_df):
+        raise ValueError(f"В выборке {len(sample_df)} строк, а оценок {len(scores)}")
+    df = sample_df.copy()
+    df['inflation_score'] = scores
+    return df
+
+
+def add_age_groups(df: pd.DataFrame, agemax: int = 100) -> pd.DataFrame:
+    """Колонка age_group с теми же границами, что и в make_sample.dosample"""
+    sampler = dosample(df, agemax, None)
+    sampler.add_age_groups()
+    return sampler.df
+
+
+def shares(scores, categories: list, weights=None) -> pd.Series:
+    """Доли категорий ответа в процентах (с весами, если заданы)"""
+    scores = np.asarray(scores, dtype=np.int64)
+    lookup = np.full(max(max(categories), scores.max(initial=0)) + 1, -1, dtype=np.int64)
+    lookup[categories] = np.arange(len(categories))
+    codes = lookup[scores]
+    valid = codes >= 0
+    weights = None if weights is None else np.asarray(weights, dtype=np.float64)[valid]
+    counts = np.bincount(codes[valid], weights=weights, minlength=len(categories))
+    return pd.Series(counts / counts.sum() * 100, index=pd.Index(categories, name='inflation_score'))
+
+
+def population_margins(population_df: pd.DataFrame, columns=rake_columns, weight: str = 'weight',
+                       agemax: int = 100) -> dict:
+    """
+    Маргиналы генеральной совокупности по исходному массиву (df1 / df2) с весами опроса.
+
+    Returns:
+        {колонка: Series долей по ее значениям}
+    """
+    if 'age_group' in columns and 'age_group' not in population_df.columns:
+        population_df = add_age_groups(population_df, agemax)
+    w = population_df[weight] if weight is not None else pd.Series(1.0, index=population_df.index)
+    return {
+        column: w.groupby(population_df[column], observed=True).sum() / w.sum()
+        for column in columns
+    }
+
+
+def rake(df: pd.DataFrame, margins: dict, weight: str = None, max_iter: int = 100, tol: float = 1e-6) -> np.ndarray:
+    """
+    Итеративная пропорциональная подгонка (IPF, raking) весов к маргиналам.
+
+    Каждый шаг - один np.bincount по коду значения признака и умножение весов на поправку своей ячейки.
+    Значения признака, которых нет в выборке, исключаются из маргинала, остальные доли перенормируются.
+
+    Args:
+        margins: {колонка: Series долей} (population_margins)
+        weight: колонка начальных весов; по умолчанию все веса равны 1
+        tol: максимальное относительное отклонение итоговых маргиналов от целевых
+
+    Returns:
+        массив весов той же длины, что df; сумма весов равна числу строк
+    """
+    n = len(df)
+    w = df[weight].to_numpy(dtype=np.float64).copy() if weight is not None else np.ones(n)
+    w *= n / w.sum()
+
+    codes, targets = [], []
+    for column, margin in margins.items():
+        categories = pd.Index(margin.index)
+        column_codes = categories.get_indexer(df[column])
+        if (column_codes < 0).any():
+            missing = pd.unique(df[column][column_codes < 0])
+            raise ValueError(f"Значений {column} {list(missing)} нет в маргиналах генеральной совокупности")
+        target = margin.to_numpy(dtype=np.float64)
+        present = np.bincount(column_codes, minlength=len(categories)) > 0
+        target = np.where(present, target, 0.0)
+        codes.append(column_codes)
+        targets.append(target / target.sum() * n)
+
+    for _ in range(max_iter):
+        worst = 0.0
+        for column_codes, target in zip(codes, targets):
+            totals = np.bincount(column_codes, weights=w, minlength=len(target))
+            factor = np.divide(target, totals, out=np.ones_like(target), where=totals > 0)
+            w *= factor[column_codes]
+        for column_codes, target in zip(codes, targets):
+            totals = np.bincount(column_codes, weights=w, minlength=len(target))
+            active = target > 0
+            worst = max(worst, np.max(np.abs(totals[active] / target[active] - 1)))
+        if worst < tol:
+            break
+    return w
+
+
+def estimate(sample_df: pd.DataFrame, responses, q_num: int, population_df: pd.DataFrame = None,
+             weight: str = 'weight', columns=rake_columns, agemax: int = 100, benchmark: dict = None) -> pd.DataFrame:
+    """
+    Распределение ответов в процентах тремя способами:
+        unweighted - доли по числу ответов;
+        weighted - с весами опроса из колонки weight;
+        raked - веса подогнаны к маргиналам population_df (df1 / df2 с весами опроса) по признакам columns;
+            без population_df строка не выводится: калибровка выборки к ее же маргиналам дала бы weighted.
+    Если benchmark не None (например, results_store.vciom_benchmark[q_num]), он добавляется строкой vciom.
+
+    Returns:
+        DataFrame: строки - способы оценки, колонки - значения inflation_score
+    """
+    categories = score_categories[q_num]
+    df = add_age_groups(join_scores(sample_df, responses), agemax)
+    scores = df['inflation_score'].to_numpy()
+
+    rows = {
+        'unweighted': shares(scores, categories),
+        'weighted': shares(scores, categories, df[weight])
+    }
+    if population_df is not None:
+        margins = population_margins(population_df, columns, weight, agemax)
+        rows['raked'] = shares(scores, categories, rake(df, margins, weight))
+    result = pd.DataFrame(rows).T
+    if benchmark is not None:
+        result.loc['vciom'] = [benchmark[category] for category in categories]
+    return result
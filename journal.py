@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+import pandas as pd
+
+# Префиксы, с которых Agent начинает строку вместо ответа модели
+error_prefixes = ("Ошибка генерации", "Ошибка при обработке запроса", "Не удалось получить ответ")
+
+
+def is_error_response(response: str) -> bool:
+    """Проверяет, что вместо ответа модели сохранена строка ошибки"""
+    return not isinstance(response, str) or response.startswith(error_prefixes)
+
+
+class RunJournal:
+    """
+    Журнал прогона: каждая обработанная строка выборки дописывается в JSONL-файл сразу после ответа.
+    Запись - одна строка {"run_id", "row", "response", "inflation_score", "time_to_answer"}, при повторе строки
+    действует последняя запись. fsync выполняется пачками раз в fsync_every записей и при close().
+
+    После падения, перезапуска ядра или истекшего ключа прогон продолжается с тем же run_id:
+    runner.run_concurrent(..., journal=RunJournal(run_id)) пропустит уже готовые строки
+    и повторит только строки с ошибками.
+    """
+
+    def __init__(self, run_id: str, directory: str = "runs", fsync_every: int = 16):
+        self.run_id = run_id
+        self.path = os.path.join(directory, f"{run_id}.jsonl")
+        self.fsync_every = fsync_every
+        self.pending = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._truncate_torn_tail()
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _truncate_torn_tail(self):
+        """Отрезает недописанную последнюю строку, оставшуюся после аварийного завершения"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def append(self, row: int, response: str, score: int, time_to_answer: float = None):
+        """Атомарно дописывает результат строки: одна запись - один вызов write"""
+        record = {"run_id": self.run_id, "row": int(row), "response": response, "inflation_score": int(score),
+                  "time_to_answer": time_to_answer}
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.lock:
+            os.write(self.fd, line)
+            self.pending += 1
+            if self.pending >= self.fsync_every:
+                os.fsync(self.fd)
+                self.pending = 0
+
+    def records(self) -> dict:
+        """Последняя запись по каждой строке: {row: record}"""
+        latest = {}
+        if not os.path.exists(self.path):
+            return latest
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                record = json.loads(line)
+                latest[record["row"]] = record
+        return latest
+
+    def completed(self) -> dict:
+        """Успешно обработанные строки: {row: (response, inflation_score)}"""
+        return {
+            row: (record["response"], record["inflation_score"])
+            for row, record in self.records().items()
+            if not is_error_response(record["response"])
+        }
+
+    def export(self, filename: str):
+        """
+        Собирает итоговый файл из журнала за один проход.
+        Формат совпадает с Agent.save_responses_to_csv; для .parquet пишется Parquet.
+        """
+        records = self.records()
+        df = pd.DataFrame(
+            [(records[row]["response"], records[row]["inflation_score"]) for row in sorted(records)],
+            index=sorted(records),
+            columns=["response", "inflation_score"]
+        )
+        if filename.endswith(".parquet"):
+            df.to_parquet(filename, index=True)
+        else:
+            df.to_csv(filename, index=True, encoding="utf-8")
+        print(f"Результаты сохранены в файл: {filename}")
+
+    def flush(self):
+        with self.lock:
+            os.fsync(self.fd)
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            os.fsync(self.fd)
+            os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
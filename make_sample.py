@@ -2,15 +2,60 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+def largest_remainder(shares: np.ndarray, total: int, capacity: np.ndarray = None) -> np.ndarray:
+    """
+    Делит total единиц пропорционально shares методом наибольших остатков.
+    capacity ограничивает размер каждой страты (нельзя отобрать больше, чем есть);
+    не поместившийся излишек перераспределяется между остальными стратами.
+    """
+    shares = np.asarray(shares, dtype=np.float64)
+    allocation = np.zeros(len(shares), dtype=np.int64)
+    if capacity is None:
+        capacity = np.full(len(shares), np.iinfo(np.int64).max)
+    total = min(total, int(np.minimum(capacity, np.iinfo(np.int64).max).sum()))
+    while allocation.sum() < total:
+        open_ = allocation < capacity
+        left = total - allocation.sum()
+        quota = np.where(open_, shares, 0.0)
+        if quota.sum() <= 0:
+            # у незаполненных страт нулевой вес - делим поровну
+            quota = open_.astype(np.float64)
+        quota = quota / quota.sum() * left
+        extra = np.floor(quota).astype(np.int64)
+        remainder = left - extra.sum()
+        if remainder:
+            # остаток раздается стратам с наибольшей дробной частью
+            order = np.argsort(-(quota - extra), kind="stable")
+            extra[order[:remainder]] += 1
+        allocation = np.minimum(allocation + extra, capacity)
+    return allocation
+
+
 class dosample:
-    def __init__(self, df, agemax, seed):
+    # Признаки, по которым можно стратифицировать выборку
+    strata_columns = ['age_group', 'SEX', 'FO', 'TIP', 'EDU', 'DOHOD']
+
+    def __init__(self, df, agemax, seed, strata=('age_group',), sample_size=311, weight=None):
+        """
+        Args:
+            df: исходная выборка респондентов (df1 / df2)
+            agemax: верхняя граница последней возрастной группы
+            seed: seed генератора numpy
+            strata: признаки стратификации, любое сочетание из strata_columns
+            sample_size: размер итоговой выборки
+            weight: колонка весов (например 'weight'); если задана, размер страты
+                пропорционален сумме весов, иначе - числу респондентов
+        """
         self.df = df.copy()  
         self.agemax = agemax
         self.seed = seed
+        self.strata = list(strata)
+        self.sample_size = sample_size
+        self.weight = weight
         self.labels = None 
 
-    def create_sample(self):
-        """Создает стратифицированную выборку по возрастным группам"""
+    def add_age_groups(self):
+        """Добавляет колонку age_group"""
         bins = [18, 35, 55, 65, self.agemax]
         self.labels = [f'18-34', f'35-54', f'55-64', f'65-{self.agemax}']  
         self.df['age_group'] = pd.cut(
@@ -19,31 +64,44 @@ class dosample:
             labels=self.labels, 
             right=False
         )
-        
-        total_original = len(self.df)
-        sample_size = 311
-        
-        strata_sizes = {}
-        for group in self.labels:
-            group_count = len(self.df[self.df['age_group'] == group])
-            strata_size = max(1, round((group_count / total_original) * sample_size))
-            strata_sizes[group] = strata_size
-        
-        total_sampled = sum(strata_sizes.values())
-        if total_sampled != sample_size:
-            largest_strata = max(strata_sizes, key=strata_sizes.get)
-            strata_sizes[largest_strata] += sample_size - total_sampled
-        
-        sampled_data = pd.DataFrame()
-        for group, size in strata_sizes.items():
-            stratum = self.df[self.df['age_group'] == group]
-            if len(stratum) >= size:
-                sampled_stratum = stratum.sample(n=size, random_state=self.seed)
-            else:
-                sampled_stratum = stratum
-            sampled_data = pd.concat([sampled_data, sampled_stratum])
-        
-        return sampled_data
+
+    def allocate(self) -> pd.DataFrame:
+        """
+        Размер каждой страты в выборке (метод наибольших остатков).
+
+        Returns:
+            DataFrame с колонками strata + population (число или сумма весов) + available + size
+        """
+        self.add_age_groups()
+        grouped = self.df.groupby(self.strata, observed=True, dropna=True)
+        strata = grouped.size().rename('available').to_frame()
+        if self.weight is not None:
+            strata['population'] = grouped[self.weight].sum()
+        else:
+            strata['population'] = strata['available']
+        strata['size'] = largest_remainder(strata['population'].to_numpy(), self.sample_size,
+                                           strata['available'].to_numpy())
+        return strata.reset_index()
+
+    def sample_indices(self) -> np.ndarray:
+        """Позиции (iloc) отобранных строк, упорядоченные по стратам"""
+        strata = self.allocate()
+        rng = np.random.default_rng(self.seed)
+        codes = self.df.groupby(self.strata, observed=True, dropna=True).ngroup().to_numpy()
+        sizes = strata['size'].to_numpy()
+
+        # случайный порядок внутри страты: сортируем по номеру страты + случайной дроби
+        valid = codes >= 0
+        positions = np.flatnonzero(valid)
+        order = positions[np.argsort(codes[valid] + rng.random(len(positions)), kind='stable')]
+        sorted_codes = codes[order]
+        starts = np.searchsorted(sorted_codes, np.arange(len(sizes)))
+        rank = np.arange(len(order)) - starts[sorted_codes]
+        return order[rank < sizes[sorted_codes]]
+
+    def create_sample(self):
+        """Создает стратифицированную выборку по признакам self.strata"""
+        return self.df.iloc[self.sample_indices()]
 
     def viz_for_sample(self, sampled_data):
         total_original = len(self.df)
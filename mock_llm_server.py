@@ -0,0 +1,113 @@
+"""
+Локальная замена Anthropic Messages API (POST /v1/messages) для замеров без расхода кредитов.
+
+    MOCK_LATENCY_MEDIAN=0.8 MOCK_RATE_429=0.02 uvicorn mock_llm_server:app --port 8766
+
+Ответ строится детерминированно по запросу (backends.StubBackend), задержка - логнормальная.
+Настройки (переменные окружения):
+    MOCK_LATENCY_MEDIAN - медиана задержки ответа, сек (по умолчанию 0.5)
+    MOCK_LATENCY_SIGMA - sigma логнормального распределения задержки (0 - постоянная задержка)
+    MOCK_RATE_429, MOCK_RATE_529 - доли запросов, на которые возвращается rate limit / overloaded
+    MOCK_RETRY_AFTER - заголовок retry-after для 429, сек
+    MOCK_SEED - seed задержек, ошибок и текста ответов
+Поддерживается и stream=true (SSE в формате Messages API). GET /stats - счетчики запросов и ошибок.
+"""
+import asyncio
+import json
+import math
+import os
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from backends import StubBackend
+
+app = FastAPI()
+
+LATENCY_MEDIAN = float(os.environ.get("MOCK_LATENCY_MEDIAN", 0.5))
+LATENCY_SIGMA = float(os.environ.get("MOCK_LATENCY_SIGMA", 0.3))
+RATE_429 = float(os.environ.get("MOCK_RATE_429", 0))
+RATE_529 = float(os.environ.get("MOCK_RATE_529", 0))
+RETRY_AFTER = os.environ.get("MOCK_RETRY_AFTER", "1")
+SEED = int(os.environ.get("MOCK_SEED", 0))
+
+rng = np.random.default_rng(SEED)
+stub = StubBackend(seed=SEED)
+counters = {"requests": 0, "streams": 0, "errors_429": 0, "errors_529": 0, "input_tokens": 0, "output_tokens": 0}
+
+
+def error_response(status: int, error_type: str, message: str, headers: dict = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"type": "error", "error": {"type": error_type, "message": message}},
+        headers=headers
+    )
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_message(message: dict, latency: float):
+    """Отдает ответ событиями SSE; задержка делится между первым токеном и остальным текстом"""
+    text, usage = message["content"][0]["text"], message["usage"]
+    chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+    yield sse("message_start", {"type": "message_start", "message": {
+        **message, "content": [], "stop_reason": None, "usage": {**usage, "output_tokens": 1}
+    }})
+    yield sse("content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}})
+    await asyncio.sleep(latency / 2)
+    for chunk in chunks:
+        await asyncio.sleep(latency / 2 / len(chunks))
+        yield sse("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": chunk}})
+    yield sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield sse("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": usage["output_tokens"]}})
+    yield sse("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages")
+async def create_message(request: Request):
+    body = await request.json()
+    counters["requests"] += 1
+
+    roll = rng.random()
+    if roll < RATE_429:
+        counters["errors_429"] += 1
+        return error_response(429, "rate_limit_error", "Number of requests has exceeded your rate limit",
+                              {"retry-after": RETRY_AFTER})
+    if roll < RATE_429 + RATE_529:
+        counters["errors_529"] += 1
+        return error_response(529, "overloaded_error", "Overloaded")
+
+    text, usage = stub.complete(body)
+    counters["input_tokens"] += usage.input_tokens
+    counters["output_tokens"] += usage.output_tokens
+    latency = LATENCY_MEDIAN * math.exp(LATENCY_SIGMA * rng.standard_normal()) if LATENCY_SIGMA else LATENCY_MEDIAN
+    message = {
+        "id": f"msg_mock_{counters['requests']}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "mock"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": usage.input_tokens, "output_tokens": usage.output_tokens,
+                  "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+    }
+    if body.get("stream"):
+        counters["streams"] += 1
+        return StreamingResponse(stream_message(message, latency), media_type="text/event-stream")
+    await asyncio.sleep(latency)
+    return message
+
+
+@app.get("/stats")
+def get_stats():
+    return counters
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "healthy"}
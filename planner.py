@@ -0,0 +1,136 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from agent import AgentEngine
+from cache import CacheMiss
+from journal import is_error_response
+from runner import RateLimiter
+
+# Колонки, от которых зависит текст профиля в AgentEngine.create_profile
+profile_columns = AgentEngine.profile_columns
+
+
+def plan_cells(sample_df: pd.DataFrame, seed: int = None) -> pd.DataFrame:
+    """
+    Разбивает выборку на ячейки персон: строки с одинаковыми демографией и bias
+    получают одинаковый профиль и могут разделить один вызов search.
+
+    seed: bias строки выбирается так же, как в runner.run_concurrent (AgentEngine.seeded_bias по номеру
+    строки в sample_df), поэтому при одном seed прогоны через ячейки и напрямую получают одинаковых персон; без seed - случайно
+
+    Returns:
+        копия sample_df с колонками bias (выбранное искажение) и cell (номер ячейки)
+    """
+    plan = sample_df.copy()
+    if seed is not None:
+        plan["bias"] = [AgentEngine.seeded_bias(row, seed, i) for i, (_, row) in enumerate(sample_df.iterrows())]
+    else:
+        plan["bias"] = np.random.default_rng().choice(AgentEngine.biases, len(plan))
+    plan["cell"] = plan.groupby(profile_columns + ["bias"], sort=False, dropna=False).ngroup()
+    return plan
+
+
+def describe_cell(engine: AgentEngine, row) -> str:
+    """
+    Описание ситуации ячейки (engine.describe_situation). Промах кэша в режиме replay не прерывает
+    весь прогон: ячейка получает строку ошибки, и ее строки не отвечают (см. cell_error)
+    """
+    try:
+        return engine.describe_situation(row, row["bias"])
+    except CacheMiss as e:
+        return f"Ошибка генерации: {e}"
+
+
+def cell_error(situation: str) -> dict:
+    """Результат строки ячейки, для которой не удалось получить описание ситуации"""
+    return {"response": situation, "inflation_score": 0, "time_to_answer": None}
+
+
+def _cell_contexts(engine: AgentEngine, plan: pd.DataFrame, executor: ThreadPoolExecutor) -> dict:
+    """
+    Один вызов search ("экономическая ситуация") на каждую ячейку.
+    Для ячеек с ошибкой значение - строка ошибки (journal.is_error_response)
+    """
+    representatives = plan.drop_duplicates("cell")
+
+    def describe(row):
+        return row["cell"], describe_cell(engine, row)
+
+    return dict(executor.map(describe, [row for _, row in representatives.iterrows()]))
+
+
+def run_planned(api_key: str, sample_df: pd.DataFrame, query: str, q_num: int, max_workers: int = 8,
+                requests_per_min: float = 50, tokens_per_min: float = 30000,
+                model: str = "claude-sonnet-4-20250514", limiter: RateLimiter = None, cache=None,
+                seed: int = None, engine: AgentEngine = None, prompt_caching: bool = False) -> list:
+    """
+    Аналог runner.run_concurrent, в котором вызов search выполняется один раз на ячейку персон,
+    а затем контекст ячейки раздается всем ее строкам для финального ответа.
+    prompt_caching: профиль и ситуация ячейки - кэшируемый префикс промпта (см. AgentEngine)
+
+    Returns:
+        список пар (response, inflation_score) в порядке строк sample_df
+    """
+    if limiter is None:
+        limiter = RateLimiter(requests_per_min, tokens_per_min)
+    if engine is None:
+        engine = AgentEngine(api_key, model, limiter=limiter, cache=cache, prompt_caching=prompt_caching)
+
+    plan = plan_cells(sample_df, seed)
+    # номер строки внутри ячейки различает в кэше ответы одинаковых персон
+    plan["draw"] = plan.groupby("cell").cumcount()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        contexts = _cell_contexts(engine, plan, executor)
+
+        def answer(row):
+            situation = contexts[row["cell"]]
+            if is_error_response(situation):
+                return situation, cell_error(situation)["inflation_score"]
+            response = engine.process_query(query, row, q_num, row["bias"], row["draw"], situation)
+            return response, engine.extract_inflation_score(response, q_num)
+
+        return list(executor.map(answer, [row for _, row in plan.iterrows()]))
+
+
+def run_cell_draws(api_key: str, sample_df: pd.DataFrame, query: str, q_num: int, draws_per_cell: int = 1,
+                   max_workers: int = 8, requests_per_min: float = 50, tokens_per_min: float = 30000,
+                   model: str = "claude-sonnet-4-20250514", limiter: RateLimiter = None, cache=None,
+                   seed: int = None, engine: AgentEngine = None, prompt_caching: bool = False) -> pd.DataFrame:
+    """
+    Вместо ответа на каждую строку делает draws_per_cell независимых финальных ответов на ячейку.
+    prompt_caching: профиль и ситуация ячейки - кэшируемый префикс промпта (см. AgentEngine)
+
+    Returns:
+        DataFrame с колонками cell, draw, n_rows (сколько строк выборки в ячейке),
+        response, inflation_score; n_rows можно использовать как вес при подсчете долей
+    """
+    if limiter is None:
+        limiter = RateLimiter(requests_per_min, tokens_per_min)
+    if engine is None:
+        engine = AgentEngine(api_key, model, limiter=limiter, cache=cache, prompt_caching=prompt_caching)
+
+    plan = plan_cells(sample_df, seed)
+    cells = plan.drop_duplicates("cell").set_index("cell")
+    n_rows = plan["cell"].value_counts()
+    tasks = [(cell, draw) for cell in cells.index for draw in range(draws_per_cell)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        contexts = _cell_contexts(engine, plan, executor)
+
+        def answer(task):
+            cell, draw = task
+            row = cells.loc[cell]
+            if is_error_response(contexts[cell]):
+                response = contexts[cell]
+            else:
+                response = engine.process_query(query, row, q_num, row["bias"], draw, contexts[cell])
+            return {
+                "cell": cell,
+                "draw": draw,
+                "n_rows": n_rows[cell],
+                "response": response,
+                "inflation_score": engine.extract_inflation_score(response, q_num)
+            }
+
+        return pd.DataFrame(list(executor.map(answer, tasks)))
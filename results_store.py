@@ -0,0 +1,205 @@
+import os
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from bootstrap import score_categories
+
+# Распределения ответов ВЦИОМ, % (те же числа, что в сравнительных таблицах main.ipynb)
+vciom_benchmark = {
+    1: {5: 28, 4: 51, 3: 10, 2: 2, 1: 1, 0: 7},
+    2: {3: 41, 2: 33, 1: 14, 0: 12}
+}
+
+# Демографические колонки выборки, которые сохраняются вместе с ответами
+demographic_columns = ["SEX", "TIP", "AGE", "FO", "EDU", "DOHOD", "PROF"]
+
+
+class RunResultsStore:
+    """
+    Результаты прогонов в колоночном виде вместо CSV-артефактов.
+
+    Раскладка:
+        root/q_num=<N>/run_id=<id>/part-0.parquet - строки прогона: row, inflation_score (int8),
+            демография (словарное кодирование), weight, response
+        root/runs.parquet - индекс прогонов: run_id, q_num, created, n_rows и метаданные прогона
+
+    Запросы читают только нужные колонки (memory-mapped Arrow), а доли и расхождение с ВЦИОМ
+    считаются сразу по всем прогонам одним проходом np.bincount.
+    """
+
+    def __init__(self, root: str = "results"):
+        self.root = root
+        self.index_path = os.path.join(root, "runs.parquet")
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _run_dir(self, q_num: int, run_id: str) -> str:
+        return os.path.join(self.root, f"q_num={q_num}", f"run_id={run_id}")
+
+    def runs(self, q_num: int = None) -> pd.DataFrame:
+        """Индекс прогонов (по одному вопросу или по всем)"""
+        if not os.path.exists(self.index_path):
+            return pd.DataFrame(columns=["run_id", "q_num", "created", "n_rows"])
+        index = pd.read_parquet(self.index_path)
+        if q_num is not None:
+            index = index[index["q_num"] == q_num]
+        return index.reset_index(drop=True)
+
+    def _save_index(self, index: pd.DataFrame):
+        # как manifest в storage.ResponseStore: пишем во временный файл и атомарно подменяем
+        tmp_path = self.index_path + ".tmp"
+        index.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def _to_table(responses, sample_df: pd.DataFrame = None) -> pa.Table:
+        if isinstance(responses, pd.DataFrame):
+            frame = responses[["response", "inflation_score"]].reset_index(drop=True)
+        else:
+            frame = pd.DataFrame(responses, columns=["response", "inflation_score"])
+        columns = {
+            "row": pa.array(np.arange(len(frame), dtype=np.int32)),
+            "inflation_score": pa.array(frame["inflation_score"].to_numpy(dtype=np.int8))
+        }
+        if sample_df is not None:
+            if len(sample_df) != len(frame):
+                raise ValueError(f"В выборке {len(sample_df)} строк, а ответов {len(frame)}")
+            for column in demographic_columns:
+                if column in sample_df.columns:
+                    values = pd.to_numeric(sample_df[column], errors="coerce").to_numpy(dtype=np.float64)
+                    columns[column] = pa.array(values).cast(pa.int16()).dictionary_encode()
+            if "weight" in sample_df.columns:
+                columns["weight"] = pa.array(sample_df["weight"].to_numpy(dtype=np.float64))
+        columns["response"] = pa.array(frame["response"].astype(str).tolist(), pa.string())
+        return pa.table(columns)
+
+    def write_run(self, run_id: str, q_num: int, responses, sample_df: pd.DataFrame = None, **metadata) -> str:
+        """
+        Сохраняет прогон (повторная запись с тем же run_id заменяет его).
+
+        Args:
+            responses: список пар (response, inflation_score) как у runner.run_concurrent
+                или DataFrame с колонками response, inflation_score
+            sample_df: выборка, на которой получены ответы (в том же порядке) - для демографии и весов
+            metadata: произвольные поля индекса прогона (model, query, seed, mlflow_run_id, ...)
+
+        Returns:
+            путь к файлу прогона
+        """
+        table = self._to_table(responses, sample_df)
+        run_dir = self._run_dir(q_num, run_id)
+        os.makedirs(run_dir, exist_ok=True)
+        path = os.path.join(run_dir, "part-0.parquet")
+        tmp_path = path + ".tmp"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)
+
+        entry = {"run_id": run_id, "q_num": q_num, "created": datetime.now().isoformat(), "n_rows": table.num_rows}
+        entry.update({key: str(value) for key, value in metadata.items()})
+        with self.lock:
+            index = self.runs()
+            index = index[~((index["run_id"] == run_id) & (index["q_num"] == q_num))]
+            self._save_index(pd.concat([index, pd.DataFrame([entry])], ignore_index=True))
+        return path
+
+    def import_csv(self, run_id: str, q_num: int, filename: str, sample_df: pd.DataFrame = None, **metadata) -> str:
+        """Переносит файл Agent.save_responses_to_csv (например, inflation_responses_1.csv) в хранилище"""
+        df = pd.read_csv(filename, index_col=0)
+        return self.write_run(run_id, q_num, df, sample_df, source=filename, **metadata)
+
+    def load(self, q_num: int, columns: list, run_ids: list = None) -> pa.Table:
+        """
+        Нужные колонки всех прогонов вопроса одной таблицей Arrow.
+        run_id возвращается словарной колонкой (индексы - номера прогонов).
+        """
+        path = os.path.join(self.root, f"q_num={q_num}")
+        if not os.path.exists(path):
+            raise KeyError(f"В хранилище нет прогонов по вопросу {q_num}")
+        filters = [("run_id", "in", list(run_ids))] if run_ids is not None else None
+        partitioning = ds.HivePartitioning.discover(infer_dictionary=True)
+        # схема берется по всем файлам, а не по первому: у прогонов без sample_df нет демографии и weight,
+        # у них эти колонки читаются как null
+        dataset = ds.dataset(path, format="parquet", partitioning=partitioning)
+        schema = pa.unify_schemas([dataset.schema] + [fragment.physical_schema for fragment in dataset.get_fragments()])
+        return pq.read_table(
+            path,
+            columns=columns,
+            filters=filters,
+            memory_map=True,
+            partitioning=partitioning,
+            schema=schema
+        )
+
+    def query(self, q_num: int, columns: list, run_ids: list = None) -> pd.DataFrame:
+        """То же, что load, но в виде pandas DataFrame"""
+        return self.load(q_num, columns, run_ids).to_pandas()
+
+    def shares(self, q_num: int, run_ids: list = None, weight: str = None) -> pd.DataFrame:
+        """
+        Доли ответов каждого прогона в процентах (только прогонов run_ids, если они заданы).
+
+        Returns:
+            DataFrame: строки - run_id, колонки - значения inflation_score (score_categories[q_num])
+        """
+        categories = score_categories[q_num]
+        columns = ["run_id", "inflation_score"] + ([weight] if weight else [])
+        table = self.load(q_num, columns, run_ids)
+
+        runs = table["run_id"].unify_dictionaries().combine_chunks()
+        run_codes = runs.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+        scores = table["inflation_score"].to_numpy().astype(np.int64)
+        lookup = np.full(max(max(categories), scores.max(initial=0)) + 1, -1, dtype=np.int64)
+        lookup[categories] = np.arange(len(categories))
+        score_codes = lookup[scores]
+        valid = score_codes >= 0
+        weights = None
+        if weight:
+            # у прогонов, записанных без sample_df, веса null: такие строки не учитываются
+            weights = table[weight].to_numpy(zero_copy_only=False).astype(np.float64)
+            valid &= ~np.isnan(weights)
+            weights = weights[valid]
+
+        n_runs, n_categories = len(runs.dictionary), len(categories)
+        counts = np.bincount(run_codes[valid] * n_categories + score_codes[valid], weights=weights,
+                             minlength=n_runs * n_categories).reshape(n_runs, n_categories)
+        totals = counts.sum(axis=1, keepdims=True)
+        # у прогона без учтенных строк (например, без весов при weight=...) доли не определены - NaN
+        shares = np.divide(counts, totals, out=np.full(counts.shape, np.nan), where=totals > 0) * 100
+        result = pd.DataFrame(shares, index=pd.Index(runs.dictionary.to_pylist(), name="run_id"),
+                              columns=pd.Index(categories, name="inflation_score"))
+        if run_ids is not None:
+            # словарь run_id содержит все партиции вопроса, а не только отобранные фильтром
+            result = result.loc[[run_id for run_id in map(str, run_ids) if run_id in result.index]]
+        return result
+
+    def divergence(self, q_num: int, benchmark: dict = None, run_ids: list = None, weight: str = None) -> pd.DataFrame:
+        """
+        Расхождение распределения ответов каждого прогона с эталоном (по умолчанию ВЦИОМ).
+
+        Returns:
+            DataFrame с индексом run_id: mae_pp (среднее отклонение, п.п.), tvd (расстояние полной вариации),
+            js (дивергенция Йенсена-Шеннона, log2) и kl (KL(прогон || эталон)), плюс колонки индекса прогонов
+        """
+        benchmark = benchmark or vciom_benchmark[q_num]
+        shares = self.shares(q_num, run_ids, weight)
+        p = shares.to_numpy() / 100
+        q = np.array([benchmark[category] for category in shares.columns], dtype=np.float64)
+        q = q / q.sum()
+
+        def kl(a, b):
+            # 0 * log(0 / b) = 0; b > 0 там, где a > 0, для эталона ВЦИОМ выполняется
+            ratio = np.divide(a, b, out=np.ones_like(a), where=(a > 0) & (b > 0))
+            return np.sum(np.where(a > 0, a * np.log2(ratio), 0.0), axis=-1)
+
+        m = (p + q) / 2
+        result = pd.DataFrame({
+            "mae_pp": np.abs(p - q).mean(axis=1) * 100,
+            "tvd": np.abs(p - q).sum(axis=1) / 2,
+            "js": (kl(p, m) + kl(np.broadcast_to(q, p.shape), m)) / 2,
+            "kl": kl(p, np.broadcast_to(q, p.shape))
+        }, index=shares.index)
+        return result.join(self.runs(q_num).set_index("run_id"))
@@ -0,0 +1,182 @@
+"""
+Прогон выборки несколькими процессами: выборка делится на шарды, у каждого процесса свой ключ API
+и свой бюджет requests/min и tokens/min, результаты шардов сливаются в один файл в порядке строк.
+
+    export ANTHROPIC_API_KEY_1=... ANTHROPIC_API_KEY_2=...
+    python run_shards.py --sample sample_df1.csv --q-num 1 --query-file query_1.txt \\
+        --key-env ANTHROPIC_API_KEY_1 ANTHROPIC_API_KEY_2 --run-id q1_seed42 --seed 42 \\
+        --output inflation_responses_1.csv
+
+bias каждой строки выбирается по --seed, ее номеру в выборке и демографии (AgentEngine.seeded_bias),
+поэтому результат не зависит от числа процессов. Каждый шард пишет журнал runs/<run-id>-shard<k>.jsonl: при повторном
+запуске с тем же run-id готовые строки пропускаются. Строки в журнале шарда нумеруются внутри шарда,
+поэтому границы шардов сохраняются в runs/<run-id>-shards.json, и продолжить прогон можно только
+с тем же числом процессов и той же выборкой. Если процессов больше, чем ключей, ключи
+раздаются по кругу, а лимиты ключа делятся между его процессами.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import pandas as pd
+from agent import Agent, AgentEngine
+from backends import AnthropicBackend
+from cache import ResponseCache
+from journal import RunJournal, is_error_response
+from runner import RateLimiter, run_concurrent
+
+
+def shard_bounds(n_rows: int, n_shards: int) -> list:
+    """Границы [start, stop) непрерывных шардов почти равного размера"""
+    edges = np.linspace(0, n_rows, n_shards + 1).round().astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(edges[:-1], edges[1:])]
+
+
+def journal_id(run_id: str, shard: int) -> str:
+    return f"{run_id}-shard{shard:03d}"
+
+
+def bounds_path(run_id: str, journal_dir: str = "runs") -> str:
+    return os.path.join(journal_dir, f"{run_id}-shards.json")
+
+
+def load_bounds(run_id: str, journal_dir: str = "runs") -> list:
+    """Границы шардов, с которыми был начат прогон, или None для нового прогона"""
+    path = bounds_path(run_id, journal_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return [tuple(bound) for bound in json.load(f)["bounds"]]
+
+
+def save_bounds(run_id: str, bounds: list, journal_dir: str = "runs"):
+    os.makedirs(journal_dir, exist_ok=True)
+    path = bounds_path(run_id, journal_dir)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"bounds": bounds}, f)
+    os.replace(path + ".tmp", path)
+
+
+def run_shard(task: dict) -> dict:
+    """Выполняется в отдельном процессе: один движок, один ключ и один RateLimiter на шард"""
+    sample_df = pd.read_csv(task["sample"]).iloc[task["start"]:task["stop"]]
+    limiter = RateLimiter(task["requests_per_min"], task["tokens_per_min"])
+    backend = AnthropicBackend(os.environ.get(task["key_env"]), base_url=task["base_url"])
+    cache = ResponseCache(task["cache"]) if task["cache"] else None
+    engine = AgentEngine(model=task["model"], limiter=limiter, cache=cache, backend=backend,
+                         stream_final=task["stream_final"])
+
+    started = time.perf_counter()
+    with RunJournal(journal_id(task["run_id"], task["shard"]), task["journal_dir"]) as journal:
+        results = run_concurrent(None, sample_df, task["query"], task["q_num"], max_workers=task["threads"],
+                                 engine=engine, journal=journal, seed=task["seed"],
+                                 first_row=task["start"])
+    if cache is not None:
+        cache.close()
+    return {
+        "shard": task["shard"],
+        "rows": len(sample_df),
+        "errors": sum(is_error_response(response) for response, _ in results),
+        "seconds": time.perf_counter() - started
+    }
+
+
+def merge_shards(run_id: str, bounds: list, journal_dir: str = "runs") -> pd.DataFrame:
+    """Собирает журналы шардов в одну таблицу response / inflation_score с индексом - номером строки выборки"""
+    frames = []
+    for shard, (start, stop) in enumerate(bounds):
+        records = RunJournal(journal_id(run_id, shard), journal_dir).records()
+        missing = set(range(stop - start)) - set(records)
+        if missing:
+            raise RuntimeError(f"В шарде {shard} нет строк {sorted(missing)[:10]}: перезапустите с тем же --run-id")
+        rows = sorted(records)
+        frames.append(pd.DataFrame(
+            [(records[row]["response"], records[row]["inflation_score"]) for row in rows],
+            index=[start + row for row in rows],
+            columns=["response", "inflation_score"]
+        ))
+    return pd.concat(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample", required=True, help="CSV выборки (sample_df1.csv / sample_df2.csv)")
+    parser.add_argument("--q-num", type=int, required=True)
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument("--query", help="текст вопроса")
+    query.add_argument("--query-file", help="файл с текстом вопроса")
+    parser.add_argument("--key-env", nargs="+", default=["ANTHROPIC_API_KEY"],
+                        help="имена переменных окружения с ключами API (по одному ключу на процесс)")
+    parser.add_argument("--processes", type=int, default=None, help="по умолчанию - число ключей")
+    parser.add_argument("--threads", type=int, default=8, help="строк одновременно в каждом процессе")
+    parser.add_argument("--requests-per-min", type=float, default=50, help="лимит одного ключа")
+    parser.add_argument("--tokens-per-min", type=float, default=30000, help="лимит одного ключа")
+    parser.add_argument("--model", default="claude-sonnet-4-20250514")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run-id", required=True)
+    parser.add_argument("--journal-dir", default="runs")
+    parser.add_argument("--cache", default=None, help="общий SQLite-кэш ответов (cache.ResponseCache)")
+    parser.add_argument("--stream-final", action="store_true")
+    parser.add_argument("--base-url", default=None, help="другой адрес Messages API (например, mock_llm_server)")
+    parser.add_argument("--output", required=True, help=".csv (формат Agent.save_responses_to_csv) или .parquet")
+    parser.add_argument("--results-root", default=None, help="дописать прогон в results_store.RunResultsStore")
+    args = parser.parse_args()
+
+    if args.query_file:
+        with open(args.query_file, encoding="utf-8") as f:
+            args.query = f.read().strip()
+    processes = args.processes or len(args.key_env)
+    n_rows = len(pd.read_csv(args.sample))
+    bounds = shard_bounds(n_rows, processes)
+    # номера строк в журналах - позиции внутри шарда: с другими границами они попали бы не тем персонам
+    saved = load_bounds(args.run_id, args.journal_dir)
+    if saved is not None and saved != bounds:
+        parser.error(f"Прогон {args.run_id} начат с {len(saved)} шардами на {saved[-1][1]} строк: "
+                     f"для продолжения укажите --processes {len(saved)} и ту же выборку или новый --run-id")
+    save_bounds(args.run_id, bounds, args.journal_dir)
+    keys = [args.key_env[shard % len(args.key_env)] for shard in range(processes)]
+
+    tasks = [{
+        "shard": shard, "start": start, "stop": stop, "sample": args.sample, "query": args.query,
+        "q_num": args.q_num, "key_env": keys[shard], "base_url": args.base_url, "model": args.model,
+        # лимиты ключа делятся между процессами, которым он достался
+        "requests_per_min": args.requests_per_min / keys.count(keys[shard]),
+        "tokens_per_min": args.tokens_per_min / keys.count(keys[shard]),
+        "threads": args.threads, "seed": args.seed, "run_id": args.run_id, "journal_dir": args.journal_dir,
+        "cache": args.cache, "stream_final": args.stream_final
+    } for shard, (start, stop) in enumerate(bounds)]
+
+    started = time.perf_counter()
+    # spawn: процессы не наследуют потоки и соединения родителя
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        reports = []
+        for report in executor.map(run_shard, tasks):
+            reports.append(report)
+            print(f"шард {report['shard']}: {report['rows']} строк за {report['seconds']:.1f} сек, "
+                  f"ошибок {report['errors']}")
+    seconds = time.perf_counter() - started
+
+    merged = merge_shards(args.run_id, bounds, args.journal_dir)
+    if args.output.endswith(".parquet"):
+        merged.to_parquet(args.output, index=True)
+        print(f"Результаты сохранены в файл: {args.output}")
+    else:
+        Agent.save_responses_to_csv(list(merged.itertuples(index=False, name=None)), args.output)
+    # без учета запуска процессов (импорт модулей занимает несколько секунд)
+    busy = max(report["seconds"] for report in reports)
+    print(f"{n_rows} строк, {processes} процессов: {n_rows / seconds:.2f} строк/сек"
+          + (f", {n_rows / busy:.2f} строк/сек без учета запуска процессов" if busy > 0 else ""))
+
+    if args.results_root:
+        from results_store import RunResultsStore
+        RunResultsStore(args.results_root).write_run(
+            args.run_id, args.q_num, merged, pd.read_csv(args.sample),
+            model=args.model, seed=args.seed, processes=processes, query=args.query
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from agent import AgentEngine
+from journal import is_error_response
+
+
+class TokenBucket:
+    """Ведро токенов: вмещает capacity единиц и пополняется со скоростью rate_per_min в минуту"""
+
+    def __init__(self, rate_per_min: float, capacity: float = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Сколько секунд нужно подождать, чтобы в ведре набралось amount единиц"""
+        self._refill(now)
+        # запрос больше ёмкости ведра пропускаем, как только ведро заполнится целиком
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Планировщик запросов к API с учетом лимитов requests/min и tokens/min.
+    Общий для всех потоков: перед каждым запросом агент вызывает acquire(),
+    после ответа - settle() с фактическим числом токенов, при 429/529 - pause().
+    """
+
+    def __init__(self, requests_per_min: float = 50, tokens_per_min: float = 30000):
+        self.requests = TokenBucket(requests_per_min)
+        self.tokens = TokenBucket(tokens_per_min)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """Блокирует поток, пока в обоих ведрах не хватит места для запроса"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                delay = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now)
+                )
+                if delay <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+            time.sleep(delay)
+
+    def settle(self, estimated: int, actual: int):
+        """Корректирует ведро токенов, когда известен фактический расход из message.usage"""
+        with self.lock:
+            self.tokens.take(actual - estimated)
+
+    def pause(self, seconds: float):
+        """Останавливает все потоки на seconds секунд (после 429 / overloaded)"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def run_concurrent(api_key: str, sample_df: pd.DataFrame, query: str, q_num: int,
+                   max_workers: int = 8, requests_per_min: float = 50, tokens_per_min: float = 30000,
+                   model: str = "claude-sonnet-4-20250514", limiter: RateLimiter = None, cache=None,
+                   journal=None, engine: AgentEngine = None, stream_final: bool = False,
+                   prompt_caching: bool = False, tracer=None, seed: int = None, first_row: int = 0,
+                   details: bool = False) -> list:
+    """
+    Прогоняет все строки выборки через AgentEngine, держа в работе до max_workers строк одновременно.
+
+    Args:
+        api_key: API ключ для Anthropic
+        sample_df: выборка респондентов (sample_df1 / sample_df2)
+        query: текст вопроса
+        q_num: номер вопроса (1 или 2)
+        max_workers: сколько строк обрабатывается параллельно
+        requests_per_min, tokens_per_min: лимиты аккаунта
+        limiter: готовый RateLimiter (например, общий для нескольких прогонов)
+        cache: cache.ResponseCache, общий для всех строк
+        journal: journal.RunJournal; каждая готовая строка сразу дописывается в журнал,
+            строки, уже успешно записанные в нем, повторно не обрабатываются (resume)
+        engine: готовый AgentEngine; по умолчанию создается один движок на весь прогон
+        stream_final: обрывать финальную генерацию после строки ответа (см. AgentEngine)
+        prompt_caching: системный промпт финального ответа с cache_control (см. AgentEngine);
+            расход токенов с учетом кэша - engine.usage_stats()
+        tracer: tracing.RunTrace для движка, создаваемого здесь (время, токены и стоимость по node)
+        seed: bias каждой строки выбирается по seed, номеру строки first_row + i и ее демографии
+            (AgentEngine.seeded_bias), поэтому повторный прогон, шарды и resume дают тех же персон; без seed - случайно
+        first_row: номер первой строки sample_df в полной выборке (у шарда - его начало)
+        details: вернуть словари response / inflation_score / time_to_answer вместо пар
+
+    Returns:
+        список пар (response, inflation_score) в порядке строк sample_df,
+        совместимый с Agent.save_responses_to_csv
+    """
+    if limiter is None:
+        limiter = RateLimiter(requests_per_min, tokens_per_min)
+    if engine is None:
+        engine = AgentEngine(api_key, model, limiter=limiter, cache=cache, stream_final=stream_final,
+                             prompt_caching=prompt_caching, tracer=tracer)
+
+    results = {}
+    if journal is not None:
+        results = {row: record for row, record in journal.records().items() if not is_error_response(record["response"])}
+    pending = [(i, row) for i, (_, row) in enumerate(sample_df.iterrows()) if i not in results]
+
+    def process(task):
+        i, row = task
+        bias = engine.seeded_bias(row, seed, first_row + i) if seed is not None else None
+        result = engine.answer(query, row, q_num, bias)
+        if journal is not None:
+            journal.append(i, result["response"], result["inflation_score"], result["time_to_answer"])
+        return i, result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results.update(executor.map(process, pending))
+    if journal is not None:
+        journal.flush()
+    if details:
+        return [results[i] for i in range(len(sample_df))]
+    return [(results[i]["response"], results[i]["inflation_score"]) for i in range(len(sample_df))]
+
+
+def run_session(api_key: str, sample_df: pd.DataFrame, questions: dict,
+                max_workers: int = 8, requests_per_min: float = 50, tokens_per_min: float = 30000,
+                model: str = "claude-sonnet-4-20250514", limiter: RateLimiter = None, cache=None,
+                journals: dict = None, engine: AgentEngine = None, stream_final: bool = False,
+                prompt_caching: bool = False, tracer=None, seed: int = None, first_row: int = 0,
+                details: bool = False) -> dict:
+    """
+    Один проход по выборке сразу для нескольких вопросов (AgentEngine.session):
+    описание ситуации персоны запрашивается один раз, ответы на вопросы генерируются параллельно.
+
+    Args:
+        questions: {q_num: текст вопроса}, например {1: query_1, 2: query_2}
+        journals: {q_num: journal.RunJournal}; строка пропускается, только если она готова во всех журналах
+        остальные - как в run_concurrent
+
+    Returns:
+        {q_num: список пар (response, inflation_score) в порядке строк sample_df}
+    """
+    if limiter is None:
+        limiter = RateLimiter(requests_per_min, tokens_per_min)
+    if engine is None:
+        engine = AgentEngine(api_key, model, limiter=limiter, cache=cache, stream_final=stream_final,
+                             prompt_caching=prompt_caching, tracer=tracer)
+    journals = journals or {}
+
+    results = {q_num: {} for q_num in questions}
+    for q_num, journal in journals.items():
+        results[q_num] = {row: record for row, record in journal.records().items()
+                          if not is_error_response(record["response"])}
+    pending = [(i, row) for i, (_, row) in enumerate(sample_df.iterrows())
+               if not all(i in results[q_num] for q_num in questions)]
+
+    def process(task):
+        i, row = task
+        bias = engine.seeded_bias(row, seed, first_row + i) if seed is not None else None
+        answers = engine.session(questions, row, bias)
+        for q_num, result in answers.items():
+            if q_num in journals:
+                journals[q_num].append(i, result["response"], result["inflation_score"], result["time_to_answer"])
+        return i, answers
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for i, answers in executor.map(process, pending):
+            for q_num, result in answers.items():
+                results[q_num][i] = result
+    for journal in journals.values():
+        journal.flush()
+    if details:
+        return {q_num: [results[q_num][i] for i in range(len(sample_df))] for q_num in questions}
+    return {
+        q_num: [(results[q_num][i]["response"], results[q_num][i]["inflation_score"]) for i in range(len(sample_df))]
+        for q_num in questions
+    }
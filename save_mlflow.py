@@ -1,27 +1,66 @@
-import os, mlflow
+import os, mlflow, tempfile, time
 import pandas as pd
 import mlflow.pyfunc
-from agent import Agent 
+from concurrent.futures import ThreadPoolExecutor
+from mlflow.entities import Metric
+from mlflow.models import infer_signature
+from agent import AgentEngine
+from runner import RateLimiter
+from score_parser import parse_scores
 
+# Все локальные модули, которые нужны InflationAgentWrapper при загрузке модели в другом процессе
+# (mlflow.pyfunc.load_model, mlflow models serve, spark_udf): сам save_mlflow и все, что он импортирует
+# (agent -> backends, score_parser; runner -> journal). При новом импорте модуль нужно добавить сюда
+model_code_paths = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ("save_mlflow.py", "agent.py", "runner.py", "score_parser.py", "backends.py", "journal.py")
+]
 
 class InflationAgentWrapper(mlflow.pyfunc.PythonModel):
+    """
+    PyFunc-модель для `mlflow models serve` и spark_udf.
+
+    model_config (задается при логировании модели):
+        model, requests_per_min, tokens_per_min - настройки движка
+        api_key_env - имя переменной окружения с ключом Anthropic (по умолчанию ANTHROPIC_API_KEY)
+    params (передаются при каждом вызове predict):
+        q_num - номер вопроса, query - текст вопроса (если во входных данных нет колонки query),
+        max_workers - сколько строк батча обрабатывается одновременно
+    """
+    profile_columns = ["PROF","SEX","AGE","FO","TIP","DOHOD","EDU"]
+    default_params = {"q_num": 1, "query": "", "max_workers": 8}
+
     def load_context(self, context):
-        # Ничего не грузим заранее — агент инициализируется на каждой строке
-        pass
-
-    def predict(self, api_key: str, q_num: int, model_input: pd.DataFrame) -> pd.DataFrame:
-        responses = []
-        for _, row in model_input.iterrows():
-            agent = Agent(
-                api_key=api_key,
-                row=row[["PROF","SEX","AGE","FO","TIP","DOHOD","EDU"]],
-                q_num=q_num
-            )
-            text = agent.process_query(row["query"])
-            score = agent.extract_inflation_score(text)
-            responses.append({"response": text, "inflation_score": score})
-
-        return pd.DataFrame(responses)
+        # Один клиент, граф и планировщик лимитов на все вызовы predict
+        config = context.model_config or {}
+        limiter = RateLimiter(config.get("requests_per_min", 50), config.get("tokens_per_min", 30000))
+        self.engine = AgentEngine(
+            api_key=os.environ.get(config.get("api_key_env", "ANTHROPIC_API_KEY")),
+            model=config.get("model", "claude-sonnet-4-20250514"),
+            limiter=limiter
+        )
+
+    def predict(self, context, model_input, params=None):
+        params = {**self.default_params, **(params or {})}
+        q_num = int(params["q_num"])
+        if "query" in model_input.columns:
+            queries = model_input["query"].tolist()
+        else:
+            queries = [params["query"]] * len(model_input)
+        rows = model_input[self.profile_columns].to_dict("records")
+
+        with ThreadPoolExecutor(max_workers=int(params["max_workers"])) as executor:
+            responses = list(executor.map(
+                lambda task: self.engine.process_query(task[0], task[1], q_num),
+                zip(queries, rows)
+            ))
+
+        parsed = parse_scores(responses, q_num)
+        return pd.DataFrame({
+            "response": responses,
+            "inflation_score": parsed["score"].to_numpy(),
+            "ambiguous": parsed["ambiguous"].to_numpy()
+        }, index=model_input.index)
     
 
 def ensure_gitignore(entry: str, gitignore_path: str = ".gitignore"):
@@ -45,6 +84,29 @@ def ensure_gitignore(entry: str, gitignore_path: str = ".gitignore"):
             f.write(f"\n{entry}\n")
     
     
+def log_trace(trace, artifact_path: str = "trace", batch_size: int = 1000):
+    """
+    Логирует tracing.RunTrace в активный run:
+        - сводные метрики (trace.*, <node>.seconds.p95, row.cost_usd.mean, ...) пачками через log_batch;
+        - гистограммы: метрика hist.<ключ> со значением = числом записей в корзине,
+          step = номер корзины (левая граница / ширина корзины);
+        - полная трасса в Parquet (artifact_path/trace.parquet) и итог по строкам (rows.parquet)
+    """
+    timestamp = int(time.time() * 1000)
+    metrics = [Metric(key, float(value), timestamp, 0) for key, value in trace.metrics().items() if value is not None]
+    for key, stats in trace.histograms().items():
+        metrics.extend(Metric(f"hist.{key}", n, timestamp, int(bucket)) for bucket, n in sorted(stats.bins.items()))
+    client = mlflow.tracking.MlflowClient()
+    run_id = mlflow.active_run().info.run_id
+    for start in range(0, len(metrics), batch_size):
+        client.log_batch(run_id, metrics=metrics[start:start + batch_size])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace.to_frame().to_parquet(os.path.join(tmp, "trace.parquet"), index=False)
+        trace.rows().to_parquet(os.path.join(tmp, "rows.parquet"))
+        mlflow.log_artifacts(tmp, artifact_path=artifact_path)
+
+
 def save_to_mlflow(artifacts: dict) -> str:
     """
     Логирует PyFunc-модель и доп. артефакты в MLflow.
@@ -55,10 +117,12 @@ def save_to_mlflow(artifacts: dict) -> str:
         "run_name": "initial_upload",
         "artifact_path": "model",
         "python_model": InflationAgentWrapper(),
-        "code_paths": ["agent.py"],
+        "code_paths": model_code_paths,  # по умолчанию; список модулей, нужных для загрузки модели
         "input_example": { ... },
+        "model_config": {"model": "claude-sonnet-4-20250514", "requests_per_min": 50},
         "metrics_csv": "path/to/your/metrics.csv",  
-        "metrics_artifact_path": "metrics"  # куда в mlruns его положить
+        "metrics_artifact_path": "metrics",  # куда в mlruns его положить
+        "trace": tracing.RunTrace  # трасса прогона (AgentEngine(tracer=...)), см. log_trace
     }
     """
     project_path = os.path.abspath(os.getcwd())
@@ -74,12 +138,24 @@ def save_to_mlflow(artifacts: dict) -> str:
 
     mlflow.set_experiment(artifacts.get("experiment_name", "default"))
 
+    # Сигнатура с params нужна, чтобы serving и spark_udf передавали q_num/query в predict
+    signature = artifacts.get("signature")
+    input_example = artifacts.get("input_example")
+    if signature is None and input_example is not None:
+        signature = infer_signature(
+            pd.DataFrame(input_example),
+            pd.DataFrame({"response": ["-"], "inflation_score": [0], "ambiguous": [False]}),
+            params=InflationAgentWrapper.default_params
+        )
+
     with mlflow.start_run(run_name=artifacts.get("run_name", None)) as run:
         mlflow.pyfunc.log_model(
             artifact_path=artifacts["artifact_path"],
             python_model=artifacts["python_model"],
-            code_paths=artifacts.get("code_paths"),
-            input_example=artifacts.get("input_example")
+            code_paths=artifacts.get("code_paths", model_code_paths),
+            input_example=input_example,
+            signature=signature,
+            model_config=artifacts.get("model_config")
         )
 
         csv_path = artifacts.get("metrics_csv")
@@ -88,6 +164,9 @@ def save_to_mlflow(artifacts: dict) -> str:
             metrics_art_path = artifacts.get("metrics_artifact_path", "")
             mlflow.log_artifact(local_path=csv_path, artifact_path=metrics_art_path)
 
+        if artifacts.get("trace") is not None:
+            log_trace(artifacts["trace"])
+
         run_id = run.info.run_id
         print(f"Модель и дополнительные артефакты залогированы в run: {run_id}")
         return run_id
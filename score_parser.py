@@ -0,0 +1,155 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Варианты ответа на каждый вопрос и соответствующие им оценки
+option_labels = {
+    1: {"Серьезно вырастут": 5,
+        "Незначительно вырастут": 4,
+        "Останутся на нынешнем уровне": 3,
+        "Незначительно снизятся": 2,
+        "Серьезно снизятся": 1,
+        "Затрудняюсь ответить": 0},
+    2: {"Инфляция очень высокая": 3,
+        "Инфляция умеренная": 2,
+        "Инфляция незначительная": 1,
+        "Затрудняюсь ответить": 0}
+}
+
+
+def _normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def _label_pattern(label: str) -> str:
+    # «е» в варианте ответа совпадает и с «ё» в тексте модели
+    return re.escape(_normalize(label)).replace("е", "[её]")
+
+
+# Итоговая строка, которую просит промпт: Ответ: «Незначительно вырастут» - 4
+# Метка «Ответ:» стоит в начале строки (допускается markdown: «**Ответ:**», «- Ответ:») и двоеточие обязательно,
+# поэтому «ответить» и «ответ» внутри предложения итоговой строкой не считаются
+answer_label_re = r"^[ \t>#*_-]*Ответ[ \t*_]*:[ \t*_]*"
+answer_re = re.compile(answer_label_re + r"[«\"“„']*([^\n«»\"“”„\-–—]*)[»\"”']*(?:[ \t]*[-–—][ \t]*(\d+))?",
+                       re.IGNORECASE | re.MULTILINE)
+answer_number_re = re.compile(answer_label_re + r"[^\n]*?[-–—]\s*(\d+)", re.IGNORECASE | re.MULTILINE)
+label_res = {
+    q_num: re.compile("|".join(f"({_label_pattern(label)})" for label in labels), re.IGNORECASE)
+    for q_num, labels in option_labels.items()
+}
+
+
+def parse_scores(responses, q_num: int) -> pd.DataFrame:
+    """
+    Извлекает оценки сразу из массива ответов модели.
+
+    Порядок разбора:
+        1. число N из итоговой строки «Ответ: «...» - N», если оно допустимо для вопроса
+           (если итоговых строк несколько - из последней с допустимым числом);
+        2. вариант ответа, названный в итоговой строке;
+        3. первый вариант ответа, упомянутый где-либо в тексте;
+        4. иначе 0.
+
+    Returns:
+        DataFrame с индексом responses и колонками:
+            score - оценка
+            source - откуда она взята: number / label / mention / none
+            ambiguous - True, если в ответе встречаются противоречащие друг другу варианты
+                (разные числа в строках «Ответ», число не совпадает с названным вариантом,
+                в тексте без итоговой строки упомянуты разные варианты)
+    """
+    labels = option_labels[q_num]
+    label_scores = {_normalize(label): score for label, score in labels.items()}
+    label_by_group = np.array(list(labels.values()), dtype=np.int64)
+    valid_scores = set(labels.values())
+
+    texts = pd.Series(responses, dtype=object)
+    texts = texts.where(texts.map(lambda t: isinstance(t, str)), "")
+
+    # 1-2. итоговая строка
+    answer = texts.str.extract(answer_re)
+    number = pd.to_numeric(answer[1], errors="coerce")
+
+    # несколько итоговых строк встречаются редко, поэтому разбираем их все только там:
+    # берется последняя строка с допустимым числом (иначе - последняя с вариантом ответа)
+    distinct_numbers = np.zeros(len(texts), dtype=np.int64)
+    several = (texts.str.count(answer_re) > 1).to_numpy()
+    if several.any():
+        def last_valid(found: list) -> tuple:
+            for label, n in reversed(found):
+                if n and int(n) in valid_scores:
+                    return label, n
+            for label, n in reversed(found):
+                if _normalize(label.strip()) in label_scores:
+                    return label, n
+            return found[-1]
+
+        last = texts[several].str.findall(answer_re).map(last_valid)
+        number[several] = pd.to_numeric(last.str[1], errors="coerce").to_numpy()
+        answer.loc[several, 0] = last.str[0].to_numpy()
+        distinct_numbers[several] = texts[several].str.findall(answer_number_re).map(
+            lambda found: len({int(n) for n in found if int(n) in valid_scores})
+        )
+    number_valid = number.isin(valid_scores).to_numpy()
+    answer_label = answer[0].fillna("").map(lambda t: label_scores.get(_normalize(t.strip()), -1)).to_numpy()
+    has_label = answer_label >= 0
+
+    # 3. упоминания вариантов нужны только ответам без итоговой строки:
+    # номер сработавшей группы регулярного выражения -> оценка
+    first_mention = np.full(len(texts), -1, dtype=np.int64)
+    distinct_mentions = np.zeros(len(texts), dtype=np.int64)
+    rest = ~number_valid & ~has_label
+    if rest.any():
+        mentions = texts[rest].str.findall(label_res[q_num]).map(
+            lambda found: [next(i for i, group in enumerate(match) if group) for match in found]
+        )
+        first_mention[rest] = mentions.map(lambda found: label_by_group[found[0]] if found else -1)
+        distinct_mentions[rest] = mentions.map(lambda found: len(set(found)))
+    has_mention = first_mention >= 0
+    score = np.select(
+        [number_valid, has_label, has_mention],
+        [np.nan_to_num(number.to_numpy()).astype(np.int64), answer_label, first_mention],
+        0
+    )
+    source = np.select(
+        [number_valid, has_label, has_mention],
+        ["number", "label", "mention"],
+        "none"
+    )
+    ambiguous = (
+        (distinct_numbers > 1)
+        | (number_valid & has_label & (answer_label != score))
+        | (rest & (distinct_mentions > 1))
+    )
+    return pd.DataFrame({"score": score, "source": source, "ambiguous": ambiguous}, index=texts.index)
+
+
+def find_answer(text: str, q_num: int) -> int:
+    """
+    Оценка из уже законченной итоговой строки «Ответ: «...» - N» или None.
+    Строка считается законченной, когда после числа пришел хотя бы один символ,
+    поэтому функцию можно вызывать на частично полученном (потоковом) тексте.
+    """
+    valid_scores = set(option_labels[q_num].values())
+    for match in answer_re.finditer(text):
+        number = match.group(2)
+        if number is not None and match.end() < len(text) and int(number) in valid_scores:
+            return int(number)
+    return None
+
+
+def parse_score(response: str, q_num: int) -> int:
+    """Оценка для одного ответа (те же правила, что и в parse_scores)"""
+    return int(parse_scores([response], q_num)["score"].iloc[0])
+
+
+def rescore_csv(filename: str, q_num: int) -> pd.DataFrame:
+    """
+    Перечитывает файл Agent.save_responses_to_csv и пересчитывает оценки.
+    Старая оценка сохраняется в колонке old_score.
+    """
+    df = pd.read_csv(filename, index_col=0)
+    parsed = parse_scores(df["response"], q_num)
+    return df.rename(columns={"inflation_score": "old_score"}).join(
+        parsed.rename(columns={"score": "inflation_score"})
+    )
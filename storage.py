@@ -0,0 +1,375 @@
+import asyncio
+import glob
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from urllib.parse import quote
+import pandas as pd
+
+
+class ResponseStore:
+    """
+    Append-only хранилище ответов опроса.
+
+    Запись - O(1): ответ дописывается одной строкой JSON в активный сегмент журнала (WAL)
+        <root>/wal/00000001.jsonl
+    Заполненные сегменты фоновой компакцией переносятся в Parquet, разбитый по дате и сценарию:
+        <root>/responses/date=2024-05-01/scenario=<сценарий>/part-00000001.parquet
+    Список готовых Parquet-файлов хранится в <root>/manifest.json и заменяется атомарно (os.replace),
+    поэтому читатель видит либо сегмент журнала, либо его Parquet-копию, но не обе сразу.
+
+    Рассчитано на один процесс API (uvicorn с одним воркером).
+    """
+
+    def __init__(self, root: str = "data", segment_max_records: int = 10000, compact_interval: float = 30.0,
+                 fsync: bool = True, legacy_file: str = None):
+        """
+        Args:
+            root: папка хранилища
+            segment_max_records: после скольких записей активный сегмент закрывается и уходит в компакцию
+            compact_interval: период фоновой компакции в секундах
+            fsync: сбрасывать ли каждую запись на диск до возврата из append
+            legacy_file: старый data/responses.parquet, который нужно подключить к хранилищу
+        """
+        self.root = root
+        self.wal_dir = os.path.join(root, "wal")
+        self.parts_dir = os.path.join(root, "responses")
+        self.manifest_path = os.path.join(root, "manifest.json")
+        self.segment_max_records = segment_max_records
+        self.compact_interval = compact_interval
+        self.fsync = fsync
+        # append_lock - порядок записей в активный сегмент; compaction_lock - согласованный снимок
+        self.append_lock = threading.Lock()
+        self.compaction_lock = threading.RLock()
+        self.stop_event = threading.Event()
+        self.compactor = None
+        self.listeners = []
+
+        os.makedirs(self.wal_dir, exist_ok=True)
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+        if legacy_file and os.path.exists(legacy_file) and legacy_file not in [p["path"] for p in self.manifest["parts"]]:
+            self.manifest["parts"].append({"path": legacy_file, "date": None, "scenario": None})
+            self._save_manifest()
+
+        segments = self._segment_ids()
+        # оставшиеся с прошлого запуска сегменты считаются закрытыми и уйдут в компакцию
+        self.active_id = max(segments + [self.manifest["last_compacted"]]) + 1
+        self.active_records = 0
+        self.active_fd = self._open_segment(self.active_id)
+
+    # ---------- журнал ----------
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self.wal_dir, f"{segment_id:08d}.jsonl")
+
+    def _segment_ids(self) -> list:
+        return sorted(int(os.path.basename(p)[:-len(".jsonl")]) for p in glob.glob(os.path.join(self.wal_dir, "*.jsonl")))
+
+    def _open_segment(self, segment_id: int) -> int:
+        return os.open(self._segment_path(segment_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    @staticmethod
+    def prepare(data: dict) -> dict:
+        """Добавляет timestamp, если он не указан"""
+        if not data.get("timestamp"):
+            data["timestamp"] = datetime.now().isoformat()
+        return data
+
+    @staticmethod
+    def _encode(data: dict) -> bytes:
+        return (json.dumps(data, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+    def append(self, data: dict) -> dict:
+        """Дописывает один ответ в журнал; возвращает сохраненную запись"""
+        return self.append_many([data])[0]
+
+    def append_many(self, records: list) -> list:
+        """Дописывает пачку ответов одним вызовом write и одним fsync"""
+        records = [self.prepare(dict(data)) for data in records]
+        with self.append_lock:
+            os.write(self.active_fd, b"".join(self._encode(data) for data in records))
+            if self.fsync:
+                os.fsync(self.active_fd)
+            self.active_records += len(records)
+            if self.active_records >= self.segment_max_records:
+                self._rotate()
+            # под append_lock, чтобы подписчики видели записи в том же порядке, что и журнал
+            for listener in self.listeners:
+                listener(records)
+        return records
+
+    def subscribe(self, listener):
+        """Регистрирует функцию, которая получает каждую сохраненную пачку записей"""
+        self.listeners.append(listener)
+
+    def _rotate(self):
+        """Закрывает активный сегмент и открывает следующий (вызывается под append_lock)"""
+        os.fsync(self.active_fd)
+        os.close(self.active_fd)
+        self.active_id += 1
+        self.active_records = 0
+        self.active_fd = self._open_segment(self.active_id)
+
+    # ---------- компакция ----------
+
+    def _load_manifest(self) -> dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        return {"last_compacted": 0, "parts": []}
+
+    def _save_manifest(self):
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_path)
+
+    @staticmethod
+    def _read_segment(path: str, length: int = None, start: int = 0) -> list:
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read() if length is None else f.read(length - start)
+        # недописанная последняя строка (после аварии) отбрасывается
+        return [json.loads(line) for line in data.split(b"\n")[:-1] if line]
+
+    @staticmethod
+    def _to_frame(records: list) -> pd.DataFrame:
+        df = pd.DataFrame(records)
+        if "additional_data" in df.columns:
+            # словари с разным набором ключей храним как JSON-строки
+            df["additional_data"] = df["additional_data"].map(lambda d: json.dumps(d, ensure_ascii=False))
+        return df
+
+    @staticmethod
+    def _partition_dates(timestamps: pd.Series) -> pd.Series:
+        """
+        Дата партиции YYYY-MM-DD. timestamp приходит от клиента, поэтому строка не используется в пути как есть:
+        она разбирается как ISO 8601, а неразбираемые значения попадают в партицию текущей даты (времени приема)
+        """
+        parsed = pd.to_datetime(timestamps.astype(str), errors="coerce", format="ISO8601", utc=True)
+        return parsed.dt.strftime("%Y-%m-%d").fillna(datetime.now().strftime("%Y-%m-%d"))
+
+    def compact(self):
+        """Переносит все закрытые сегменты журнала в партиционированный Parquet"""
+        with self.append_lock:
+            active_id = self.active_id
+        sealed = [s for s in self._segment_ids() if s < active_id]
+        for segment_id in sealed:
+            if segment_id <= self.manifest["last_compacted"]:
+                # сегмент уже в Parquet, но не был удален из-за падения
+                os.remove(self._segment_path(segment_id))
+                continue
+            records = self._read_segment(self._segment_path(segment_id))
+            new_parts = []
+            if records:
+                df = self._to_frame(records)
+                df["date"] = self._partition_dates(df["timestamp"])
+                for (date, scenario), part in df.groupby(["date", "scenario"], sort=False):
+                    directory = os.path.join(self.parts_dir, f"date={quote(date, safe='')}",
+                                             f"scenario={quote(str(scenario), safe='')}")
+                    os.makedirs(directory, exist_ok=True)
+                    path = os.path.join(directory, f"part-{segment_id:08d}.parquet")
+                    part.drop(columns="date").to_parquet(path + ".tmp", index=False)
+                    os.replace(path + ".tmp", path)
+                    new_parts.append({"path": path, "date": date, "scenario": scenario, "segment": segment_id})
+            with self.compaction_lock:
+                self.manifest["parts"].extend(new_parts)
+                self.manifest["last_compacted"] = segment_id
+                self._save_manifest()
+                os.remove(self._segment_path(segment_id))
+
+    def _compaction_loop(self):
+        while not self.stop_event.wait(self.compact_interval):
+            with self.append_lock:
+                # неполный сегмент тоже закрываем, чтобы данные не задерживались в журнале
+                if self.active_records:
+                    self._rotate()
+            self.compact()
+
+    def start(self):
+        """Запускает фоновую компакцию"""
+        if self.compactor is None:
+            self.stop_event.clear()
+            self.compactor = threading.Thread(target=self._compaction_loop, daemon=True)
+            self.compactor.start()
+
+    def stop(self):
+        """Останавливает компакцию и сбрасывает активный сегмент на диск"""
+        self.stop_event.set()
+        if self.compactor is not None:
+            self.compactor.join()
+            self.compactor = None
+        with self.append_lock:
+            os.fsync(self.active_fd)
+
+    # ---------- чтение ----------
+
+    def snapshot(self, scenario: str = None, date: str = None) -> pd.DataFrame:
+        """
+        Согласованный снимок всех ответов на момент вызова.
+        scenario / date отбирают только нужные партиции Parquet.
+        """
+        with self.compaction_lock:
+            parts = [
+                p["path"] for p in self.manifest["parts"]
+                if (scenario is None or p["scenario"] in (None, scenario))
+                and (date is None or p["date"] in (None, date))
+            ]
+            with self.append_lock:
+                active_id = self.active_id
+                active_length = os.fstat(self.active_fd).st_size
+            wal_records = []
+            for segment_id in self._segment_ids():
+                if segment_id <= self.manifest["last_compacted"]:
+                    continue
+                if segment_id < active_id:
+                    wal_records.extend(self._read_segment(self._segment_path(segment_id)))
+                elif segment_id == active_id:
+                    wal_records.extend(self._read_segment(self._segment_path(segment_id), active_length))
+
+        frames = [pd.read_parquet(path) for path in parts]
+        if wal_records:
+            frames.append(self._to_frame(wal_records))
+        if not frames:
+            return pd.DataFrame(columns=["participant_id", "scenario", "inflation_prediction", "timestamp", "additional_data"])
+        df = pd.concat(frames, ignore_index=True)
+        if scenario is not None:
+            df = df[df["scenario"] == scenario]
+        if date is not None:
+            df = df[df["timestamp"].astype(str).str[:10] == date]
+        if "additional_data" in df.columns:
+            df["additional_data"] = df["additional_data"].map(lambda d: json.loads(d) if isinstance(d, str) else d)
+        return df.reset_index(drop=True)
+
+    @staticmethod
+    def _part_segment(part: dict) -> int:
+        """Номер сегмента журнала, из которого получен Parquet-файл (старый файл - 0)"""
+        if "segment" in part:
+            return part["segment"]
+        match = re.search(r"part-(\d+)\.parquet$", part["path"])
+        return int(match.group(1)) if match else 0
+
+    def tail(self, segment_id: int = 0, offset: int = 0) -> tuple:
+        """
+        Записи, сохраненные после позиции (segment_id, offset) - водяного знака прошлого вызова.
+        Читаются только новые байты журнала и Parquet-файлы новых сегментов, поэтому время вызова
+        не зависит от числа уже прочитанных записей.
+
+        Returns:
+            (df, position, restarted):
+                df - новые записи с колонкой segment (номер сегмента журнала);
+                position - водяной знак для следующего вызова;
+                restarted - True, если сегмент segment_id уже перенесен в Parquet и его записи
+                    возвращены с начала (прочитанные ранее записи этого сегмента нужно отбросить)
+        """
+        with self.compaction_lock:
+            parts = [(self._part_segment(p), p["path"]) for p in self.manifest["parts"]]
+            parts = [(segment, path) for segment, path in parts if segment >= segment_id]
+            last_compacted = self.manifest["last_compacted"]
+            with self.append_lock:
+                active_id = self.active_id
+                active_length = os.fstat(self.active_fd).st_size
+            frames = []
+            for segment, path in sorted(parts):
+                frames.append(pd.read_parquet(path).assign(segment=segment))
+            for segment in self._segment_ids():
+                if segment <= last_compacted or segment < segment_id or segment > active_id:
+                    continue
+                records = self._read_segment(
+                    self._segment_path(segment),
+                    active_length if segment == active_id else None,
+                    offset if segment == segment_id else 0
+                )
+                if records:
+                    frames.append(self._to_frame(records).assign(segment=segment))
+
+        restarted = offset > 0 and segment_id <= last_compacted
+        if not frames:
+            return pd.DataFrame(columns=["participant_id", "scenario", "inflation_prediction", "timestamp",
+                                         "additional_data", "segment"]), (active_id, active_length), restarted
+        df = pd.concat(frames, ignore_index=True)
+        if "additional_data" in df.columns:
+            df["additional_data"] = df["additional_data"].map(lambda d: json.loads(d) if isinstance(d, str) else d)
+        return df, (active_id, active_length), restarted
+
+
+class GroupCommitWriter:
+    """
+    Групповая фиксация записей для асинхронного API.
+
+    Обработчики запросов кладут ответы в очередь и ждут подтверждения. Фоновая задача собирает
+    из очереди пачку до max_records записей или до истечения max_delay_ms с момента первой записи
+    и сохраняет ее одним ResponseStore.append_many (один write + один fsync).
+    Подтверждение приходит только после fsync, т.е. подтвержденные ответы не теряются при сбое.
+    """
+
+    def __init__(self, store: ResponseStore, max_records: int = 512, max_delay_ms: float = 5.0):
+        self.store = store
+        self.max_records = max_records
+        self.max_delay = max_delay_ms / 1000
+        self.queue = None
+        self.task = None
+
+    async def start(self):
+        """Запускает фоновую задачу в текущем event loop"""
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописывает все, что уже в очереди, и останавливает задачу"""
+        if self.task is not None:
+            await self.queue.put(None)
+            await self.task
+            self.task = None
+
+    async def submit(self, records: list) -> list:
+        """Ставит записи в очередь и ждет, пока они будут сохранены на диск"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            count = len(item[0])
+            deadline = loop.time() + self.max_delay
+            while count < self.max_records:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                count += len(item[0])
+            await self._commit(batch)
+
+    async def _commit(self, batch: list):
+        records = [record for records, _ in batch for record in records]
+        try:
+            # запись и fsync выполняются в пуле потоков, чтобы не блокировать event loop
+            saved = await asyncio.get_running_loop().run_in_executor(None, self.store.append_many, records)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        offset = 0
+        for records, future in batch:
+            if not future.done():
+                future.set_result(saved[offset:offset + len(records)])
+            offset += len(records)
@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+from agent import AgentEngine
+from bootstrap import score_categories
+from journal import is_error_response
+from planner import cell_error, describe_cell, plan_cells
+from runner import RateLimiter
+
+
+def scenario_note(scenario: str) -> str:
+    """Новость о шоке, которая добавляется к промпту после описания ситуации персоны"""
+    return f"Новость: {scenario}. Учитывай это, когда отвечаешь."
+
+
+def scenario_context(situation: str, scenario: str) -> str:
+    """Описание ситуации персоны, дополненное новостью о шоке"""
+    return f"{situation}\n{scenario_note(scenario)}"
+
+
+def run_sweep(api_key: str, sample_df: pd.DataFrame, query: str, q_num: int, scenarios: list,
+              max_workers: int = 8, requests_per_min: float = 50, tokens_per_min: float = 30000,
+              model: str = "claude-sonnet-4-20250514", limiter: RateLimiter = None, cache=None,
+              seed: int = None, engine: AgentEngine = None, store=None, prompt_caching: bool = False) -> pd.DataFrame:
+    """
+    Прогон выборки по сетке персоны × сценарии шоков ("НДС +2%", "Ключевая ставка +1%", ...).
+
+    Профиль и описание ситуации считаются один раз на ячейку персон (planner.plan_cells),
+    после чего на каждую пару строка × сценарий делается только финальный вызов.
+    Финальные вызовы ячейки ставятся в очередь сразу, как только готово ее описание,
+    поэтому поиск и ответы идут в одном пуле потоков без ожидания всех описаний.
+
+    Args:
+        scenarios: список описаний шоков
+        store: storage.ResponseStore; если передан, ответы дописываются в него в формате api.ResponseData
+        prompt_caching: профиль и ситуация ячейки - кэшируемый префикс промпта, общий для всех сценариев
+            (новость о шоке идет после него, см. AgentEngine)
+        остальные - как в planner.run_planned
+
+    Returns:
+        DataFrame в длинном формате: row, scenario, cell, bias, response, inflation_score, time_to_answer
+    """
+    if limiter is None:
+        limiter = RateLimiter(requests_per_min, tokens_per_min)
+    if engine is None:
+        engine = AgentEngine(api_key, model, limiter=limiter, cache=cache, prompt_caching=prompt_caching)
+
+    plan = plan_cells(sample_df, seed)
+    plan["draw"] = plan.groupby("cell").cumcount()
+    plan["row"] = range(len(plan))
+    representatives = plan.drop_duplicates("cell")
+    rows_by_cell = {cell: [row for _, row in group.iterrows()] for cell, group in plan.groupby("cell")}
+
+    def answer(row, scenario: str, situation: str) -> dict:
+        if is_error_response(situation):
+            # описание ячейки не получено: ответы ее строк не запрашиваются
+            result = cell_error(situation)
+        else:
+            result = engine.answer(query, row, q_num, row["bias"], row["draw"], situation, scenario_note(scenario))
+        record = {
+            "row": row["row"],
+            "scenario": scenario,
+            "cell": row["cell"],
+            "bias": row["bias"],
+            **result
+        }
+        # строки с ошибкой в хранилище ответов не попадают
+        if store is not None and not is_error_response(result["response"]):
+            store.append({
+                "participant_id": f"row-{row['row']}",
+                "scenario": scenario,
+                "inflation_prediction": result["inflation_score"],
+                "additional_data": {"q_num": q_num, "AGE": row.get("AGE"), "bias": row["bias"]}
+            })
+        return record
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        describing = {
+            executor.submit(describe_cell, engine, row): row["cell"]
+            for _, row in representatives.iterrows()
+        }
+        answering = []
+        for future in as_completed(describing):
+            situation = future.result()
+            for row in rows_by_cell[describing[future]]:
+                answering.extend(executor.submit(answer, row, scenario, situation) for scenario in scenarios)
+        records = [future.result() for future in answering]
+
+    order = {scenario: i for i, scenario in enumerate(scenarios)}
+    records.sort(key=lambda record: (record["row"], order[record["scenario"]]))
+    return pd.DataFrame(records)
+
+
+def scenario_distributions(results: pd.DataFrame, q_num: int) -> pd.DataFrame:
+    """
+    Распределение ответов по каждому сценарию в процентах.
+
+    Returns:
+        DataFrame: строки - сценарии, колонки - значения inflation_score (score_categories[q_num]), плюс n и mean
+    """
+    shares = pd.crosstab(results["scenario"], results["inflation_score"], normalize="index") * 100
+    shares = shares.reindex(columns=score_categories[q_num], fill_value=0.0)
+    grouped = results.groupby("scenario")["inflation_score"]
+    shares["n"] = grouped.size()
+    shares["mean"] = grouped.mean()
+    return shares
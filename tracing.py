@@ -0,0 +1,128 @@
+import itertools
+import threading
+import time
+import pandas as pd
+from aggregates import RunningStats
+
+# Цены, $ за миллион токенов: вход, выход, запись в кэш промпта, чтение из кэша промпта
+prices = {
+    "claude-sonnet-4-20250514": (3.0, 15.0, 3.75, 0.30),
+    "claude-3-7-sonnet-20250219": (3.0, 15.0, 3.75, 0.30),
+    "claude-3-5-haiku-20241022": (0.8, 4.0, 1.0, 0.08),
+    "claude-opus-4-20250514": (15.0, 75.0, 18.75, 1.50)
+}
+
+token_fields = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+
+def estimate_cost(model: str, usage: dict) -> float:
+    """Стоимость вызова по usage в долларах; для модели без цены - None"""
+    if model not in prices:
+        return None
+    return sum(usage[field] * price for field, price in zip(token_fields, prices[model])) / 1e6
+
+
+class RunTrace:
+    """
+    Трасса прогона: одна запись на каждый выполненный node графа AgentEngine
+    (initialize_profile, search, generate_response, answer_questions).
+
+    Запись: invocation (номер вызова графа), row (индекс строки выборки, если она передана как pd.Series), node, q_num, started, seconds, requests (вызовов LLM),
+    retries, cache_hits (ответы из cache.ResponseCache), токены из message.usage, error
+    (node вернул строку «Ошибка генерации»), cost_usd, nested (node выполнен внутри другого node,
+    например generate_response внутри answer_questions: его время уже входит во время внешнего node).
+
+    Передается в AgentEngine(tracer=...); save_mlflow.log_trace выгружает ее в MLflow.
+    """
+
+    def __init__(self, bin_width: float = 0.05):
+        self.bin_width = bin_width
+        self.records = []
+        self.lock = threading.Lock()
+        # номера вызовов графа общие для всех движков, пишущих в одну трассу
+        self.invocations = itertools.count()
+
+    def next_invocation(self) -> int:
+        return next(self.invocations)
+
+    def start(self, invocation: int, row, node: str, q_num: int, model: str, nested: bool = False) -> dict:
+        record = {"invocation": invocation, "row": row, "node": node, "q_num": q_num, "model": model, "started": time.time(),
+                  "seconds": None, "requests": 0, "retries": 0, "cache_hits": 0, "error": False, "nested": nested}
+        record.update(dict.fromkeys(token_fields, 0))
+        return record
+
+    def finish(self, record: dict):
+        record["error"] = bool(record["error"])
+        record["cost_usd"] = estimate_cost(record["model"], record)
+        with self.lock:
+            self.records.append(record)
+
+    def to_frame(self) -> pd.DataFrame:
+        with self.lock:
+            return pd.DataFrame(list(self.records))
+
+    def rows(self) -> pd.DataFrame:
+        """
+        Итог по вызовам графа (строкам выборки): время, токены, стоимость и признак ошибки.
+        Время складывается только по node верхнего уровня, счетчики - по всем записям
+        (вызовы LLM вложенного node записываются только в его собственную запись)
+        """
+        df = self.to_frame()
+        if df.empty:
+            return df
+        df["top_seconds"] = df["seconds"].where(~df["nested"].astype(bool), 0.0)
+        return df.groupby("invocation").agg(
+            row=("row", "first"),
+            seconds=("top_seconds", "sum"),
+            requests=("requests", "sum"),
+            retries=("retries", "sum"),
+            input_tokens=("input_tokens", "sum"),
+            output_tokens=("output_tokens", "sum"),
+            cost_usd=("cost_usd", "sum"),
+            error=("error", "any")
+        )
+
+    def histograms(self) -> dict:
+        """RunningStats по времени и токенам каждого node и по стоимости строки"""
+        stats = {}
+
+        def add(key: str, values, bin_width: float):
+            stats[key] = RunningStats(bin_width)
+            for value in values.dropna():
+                stats[key].update(float(value))
+
+        df = self.to_frame()
+        if df.empty:
+            return stats
+        for node, group in df.groupby("node"):
+            add(f"{node}.seconds", group["seconds"], self.bin_width)
+            add(f"{node}.input_tokens", group["input_tokens"], 50)
+            add(f"{node}.output_tokens", group["output_tokens"], 25)
+        rows = self.rows()
+        add("row.seconds", rows["seconds"], self.bin_width)
+        add("row.cost_usd", rows["cost_usd"], 0.0005)
+        return stats
+
+    def metrics(self) -> dict:
+        """Плоский словарь метрик прогона для mlflow.log_metrics"""
+        df = self.to_frame()
+        if df.empty:
+            return {}
+        rows = self.rows()
+        metrics = {
+            "trace.rows": len(rows),
+            "trace.error_rows": int(rows["error"].sum()),
+            "trace.requests": int(df["requests"].sum()),
+            "trace.retries": int(df["retries"].sum()),
+            "trace.cache_hits": int(df["cache_hits"].sum()),
+            "trace.cost_usd": float(df["cost_usd"].sum())
+        }
+        for field in token_fields:
+            metrics[f"trace.{field}"] = int(df[field].sum())
+        for key, stats in self.histograms().items():
+            summary = stats.to_dict(quantiles=(0.5, 0.95, 0.99))
+            metrics[f"{key}.mean"] = summary["mean"]
+            metrics[f"{key}.max"] = summary["max"]
+            for q, value in summary["quantiles"].items():
+                metrics[f"{key}.p{round(float(q) * 100)}"] = value
+        return metrics